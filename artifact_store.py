@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import hopsworks
+import joblib
+import numpy as np
+from model.cluster_time_range import ClusterTimeRange
+from model.model_bundle import ModelBundle
+from similarity_index import load_similarity_index
+
+
+def get_artifacts_name(time_range: ClusterTimeRange) -> str:
+    """Get the model registry name of the artifacts for the provided time range."""
+
+    if time_range == ClusterTimeRange.LAST_MONTH:
+        artifacts_name = "acm_papers_model_last_month"
+    elif time_range == ClusterTimeRange.LAST_HALF_YEAR:
+        artifacts_name = "acm_papers_model_last_half_year"
+    elif time_range == ClusterTimeRange.LAST_YEAR:
+        artifacts_name = "acm_papers_model_last_year"
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        artifacts_name = "acm_papers_model_all_time"
+
+    return artifacts_name
+
+
+def get_artifacts_dir(time_range: ClusterTimeRange) -> str:
+    """Get an empty local directory for the artifacts of the provided time range."""
+
+    artifacts_dir = os.path.join("artifacts", get_artifacts_name(time_range))
+    shutil.rmtree(artifacts_dir, ignore_errors=True)
+    os.makedirs(artifacts_dir)
+
+    return artifacts_dir
+
+
+def save_artifacts(artifacts_dir: str, time_range: ClusterTimeRange):
+    """Upload the artifacts directory as a new version to the model registry."""
+
+    project = hopsworks.login()
+    mr = project.get_model_registry()
+
+    model = mr.python.create_model(
+        name=get_artifacts_name(time_range),
+        description="Training artifacts of the clustered papers",
+    )
+    model.save(artifacts_dir)
+
+
+def load_artifacts(time_range: ClusterTimeRange) -> str | None:
+    """Download the latest artifacts for the provided time range.
+    Returns the local directory, or None if nothing has been saved yet."""
+
+    project = hopsworks.login()
+    mr = project.get_model_registry()
+
+    models = mr.get_models(get_artifacts_name(time_range))
+    if not models:
+        return None
+    latest_model = max(models, key=lambda model: model.version)
+
+    return latest_model.download()
+
+
+def save_model_bundle(bundle: ModelBundle, artifacts_dir: str):
+    """Save the models to the artifacts directory.
+    The similarity index is saved separately, together with the vectors."""
+
+    joblib.dump(bundle.vectorizer, f"{artifacts_dir}/vectorizer.joblib")
+    joblib.dump(bundle.pca, f"{artifacts_dir}/pca.joblib")
+    joblib.dump(bundle.kmeans, f"{artifacts_dir}/kmeans.joblib")
+    np.save(
+        f"{artifacts_dir}/embeddings.npy", np.asarray(bundle.embeddings, np.float32)
+    )
+    with open(f"{artifacts_dir}/drift_reference.json", "w") as file:
+        json.dump(bundle.drift_reference, file)
+
+
+def load_model_bundle(artifacts_dir: str) -> ModelBundle:
+    """Load the models from the artifacts directory."""
+
+    similarity_index, _, citations = load_similarity_index(artifacts_dir)
+    with open(f"{artifacts_dir}/drift_reference.json") as file:
+        drift_reference = json.load(file)
+    return ModelBundle(
+        vectorizer=joblib.load(f"{artifacts_dir}/vectorizer.joblib"),
+        pca=joblib.load(f"{artifacts_dir}/pca.joblib"),
+        kmeans=joblib.load(f"{artifacts_dir}/kmeans.joblib"),
+        similarity_index=similarity_index,
+        embeddings=np.load(f"{artifacts_dir}/embeddings.npy"),
+        citations=citations,
+        drift_reference=drift_reference,
+    )
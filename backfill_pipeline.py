@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
+from monthly_feature_pipeline import (
+    BufferedPaperWriter,
+    DriverPool,
+    RequestScheduler,
+    get_search_link,
+    initialize_feature_group,
+    scrape_papers_by_search_link,
+)
+
+
+def get_shards(
+    start_date: date, end_date: date, shard_size: str
+) -> list[tuple[date, date]]:
+    """Split the date range into consecutive months or weeks."""
+
+    if shard_size == "month":
+        step = relativedelta(months=1)
+    elif shard_size == "week":
+        step = relativedelta(weeks=1)
+
+    shards = []
+    shard_start_date = start_date
+    while shard_start_date <= end_date:
+        shard_end_date = min(shard_start_date + step - timedelta(days=1), end_date)
+        shards.append((shard_start_date, shard_end_date))
+        shard_start_date = shard_end_date + timedelta(days=1)
+
+    return shards
+
+
+def get_progress_path(progress_dir: str, shard: tuple[date, date]) -> str:
+    start_date, end_date = shard
+    return os.path.join(
+        progress_dir, f"{start_date.isoformat()}_{end_date.isoformat()}.json"
+    )
+
+
+def load_progress(progress_path: str) -> dict | None:
+    if not os.path.exists(progress_path):
+        return None
+    with open(progress_path) as file:
+        return json.load(file)
+
+
+def save_progress(progress_path: str, progress: dict):
+    # Write to a temporary file first, so that an interruption can't leave
+    # a half-written progress file behind
+    temporary_path = progress_path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(progress, file)
+    os.replace(temporary_path, progress_path)
+
+
+def backfill_shard(
+    shard: tuple[date, date],
+    writer: BufferedPaperWriter,
+    scheduler: RequestScheduler,
+    driver_pool: DriverPool,
+    executor: ThreadPoolExecutor,
+    progress_dir: str,
+):
+    """Scrape the papers of the shard, continuing from the saved progress."""
+
+    progress_path = get_progress_path(progress_dir, shard)
+    progress = load_progress(progress_path) or {
+        "next_page": get_search_link(*shard),
+        "pages_scraped": 0,
+        "done": False,
+    }
+    if progress["done"]:
+        print(f"Shard {shard[0]} - {shard[1]} already backfilled, skipping")
+        return
+
+    # The scraped pages whose papers are not all saved yet, in scraping order.
+    # The writer saves the papers of all shards in shared batches, so a page
+    # only counts as done once the futures of its own papers are done.
+    unsaved_pages = deque()
+    saved_papers = []
+    lock = threading.Lock()
+
+    def checkpoint_saved_pages():
+        while unsaved_pages and unsaved_pages[0]["unsaved_papers"] == 0:
+            page = unsaved_pages.popleft()
+            progress["next_page"] = page["next_page"]
+            progress["pages_scraped"] += 1
+            progress["done"] = page["next_page"] is None
+            save_progress(progress_path, progress)
+            print(
+                f"Shard {shard[0]} - {shard[1]}: "
+                f"{progress['pages_scraped']} pages scraped"
+            )
+
+    def on_paper_saved(page: dict, saved: Future):
+        with lock:
+            # After a failure, the progress stays at the pages before
+            if saved.exception() is None and page["unsaved_papers"] > 0:
+                page["unsaved_papers"] -= 1
+                checkpoint_saved_pages()
+
+    def on_page_scraped(next_page: str | None, page_saved_papers: list[Future]):
+        page = {"next_page": next_page, "unsaved_papers": len(page_saved_papers)}
+        with lock:
+            unsaved_pages.append(page)
+            saved_papers.extend(page_saved_papers)
+            checkpoint_saved_pages()
+        for saved in page_saved_papers:
+            saved.add_done_callback(lambda saved: on_paper_saved(page, saved))
+
+    scrape_papers_by_search_link(
+        progress["next_page"],
+        writer,
+        scheduler,
+        on_page_scraped,
+        driver_pool,
+        executor,
+    )
+    # Save the last papers of the shard without waiting for a full batch
+    writer.flush()
+    for saved in saved_papers:
+        saved.result()
+
+
+def backfill(
+    start_date: date,
+    end_date: date,
+    shard_size: str,
+    workers: int,
+    progress_dir: str,
+):
+    """Backfill the papers of the date range with shards running concurrently."""
+
+    os.makedirs(progress_dir, exist_ok=True)
+    shards = get_shards(start_date, end_date, shard_size)
+    print(f"Backfilling {len(shards)} shards with {workers} workers")
+
+    feature_group = initialize_feature_group()
+    # The scheduler, the paper drivers and the paper executor are shared, so
+    # the rate limit and the concurrency limit hold for all shards together.
+    # One browser runs per shard worker for the search pages, and one per
+    # thread of the paper executor, which is as large as the concurrency
+    # limit can grow.
+    scheduler = RequestScheduler(max_concurrency=2 * workers)
+    driver_pool = DriverPool(scheduler.timeout)
+    failed_shards = []
+    try:
+        with (
+            BufferedPaperWriter(feature_group) as writer,
+            ThreadPoolExecutor(max_workers=scheduler.max_concurrency) as paper_executor,
+            ThreadPoolExecutor(max_workers=workers) as executor,
+        ):
+            futures = {
+                executor.submit(
+                    backfill_shard,
+                    shard,
+                    writer,
+                    scheduler,
+                    driver_pool,
+                    paper_executor,
+                    progress_dir,
+                ): shard
+                for shard in shards
+            }
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    # The other shards continue, this one is retried on the next run
+                    print(f"Shard {shard[0]} - {shard[1]} failed: {error!r}")
+                    failed_shards.append(shard)
+    finally:
+        driver_pool.close()
+
+    print(f"Backfill finished, {len(shards) - len(failed_shards)} shards done")
+    if failed_shards:
+        raise SystemExit(f"{len(failed_shards)} shards failed, run again to resume")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill the papers of a historical date range."
+    )
+    parser.add_argument("--start", type=date.fromisoformat, required=True)
+    parser.add_argument("--end", type=date.fromisoformat, required=True)
+    parser.add_argument("--shard-size", choices=["month", "week"], default="month")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--progress-dir", default="backfill_progress")
+    args = parser.parse_args()
+
+    backfill(args.start, args.end, args.shard_size, args.workers, args.progress_dir)
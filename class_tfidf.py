@@ -0,0 +1,70 @@
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+def get_keyword_vectorizer() -> CountVectorizer:
+    """Get the vectorizer of the keyword candidates: words of at least
+    3 letters or hyphens that are not English stop words."""
+
+    return CountVectorizer(
+        stop_words="english",
+        lowercase=True,
+        token_pattern="[a-zA-Z-][a-zA-Z-]{2,}",
+    )
+
+
+def get_cluster_term_counts(
+    X_counts: sparse.csr_matrix, clusters: np.ndarray, k: int
+) -> sparse.csr_matrix:
+    """Sum the term counts of the papers in each cluster, with a single sparse product."""
+
+    n = X_counts.shape[0]
+    cluster_membership = sparse.csr_matrix(
+        (np.ones(n), (np.asarray(clusters), np.arange(n))), shape=(k, n)
+    )
+    return (cluster_membership @ X_counts).tocsr()
+
+
+def get_class_tfidf_keywords(
+    cluster_term_counts: sparse.csr_matrix, terms: np.ndarray, top_n: int = 10
+) -> list[list[str]]:
+    """Get the keywords for each cluster with class-based TF-IDF: the term
+    frequencies of a cluster are weighted by how rare the term is overall."""
+
+    term_counts = cluster_term_counts.toarray().astype(np.float64)
+    cluster_sizes = term_counts.sum(axis=1, keepdims=True)
+    term_frequencies = term_counts / np.maximum(cluster_sizes, 1)
+
+    total_term_counts = term_counts.sum(axis=0)
+    average_cluster_size = total_term_counts.sum() / max(len(term_counts), 1)
+    idf = np.log(1 + average_cluster_size / np.maximum(total_term_counts, 1))
+
+    scores = term_frequencies * idf
+    top_n = min(top_n, scores.shape[1])
+    # Select the top terms of every cluster at once, then sort only those
+    top_terms = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    top_scores = np.take_along_axis(scores, top_terms, axis=1)
+    top_terms = np.take_along_axis(top_terms, np.argsort(-top_scores, axis=1), axis=1)
+
+    all_keywords = []
+    for cluster, cluster_top_terms in enumerate(top_terms):
+        all_keywords.append(
+            [terms[term] for term in cluster_top_terms if scores[cluster, term] > 0]
+        )
+
+    return all_keywords
+
+
+def get_keyword_overlap(
+    keywords: list[list[str]], other_keywords: list[list[str]]
+) -> list[float]:
+    """Get the Jaccard similarity of the keywords of each cluster."""
+
+    overlap = []
+    for cluster_keywords, other_cluster_keywords in zip(keywords, other_keywords):
+        union = set(cluster_keywords) | set(other_cluster_keywords)
+        intersection = set(cluster_keywords) & set(other_cluster_keywords)
+        overlap.append(len(intersection) / len(union) if union else 1.0)
+
+    return overlap
@@ -0,0 +1,225 @@
+import argparse
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import queue
+import threading
+import time
+import hopsworks
+import numpy as np
+from artifact_store import load_artifacts, load_model_bundle
+from model.cluster_time_range import ClusterTimeRange
+from model.model_bundle import ModelBundle
+from preprocessing import clean_abstracts, get_parser
+from similarity_index import query_similarity_index
+
+
+class ClusterAssigner:
+    """Assign new papers to the clusters of a trained model, and place them on
+    its map at the mean position of their nearest indexed papers. The models
+    are kept in memory, so only the new papers are processed."""
+
+    def __init__(self, bundle: ModelBundle):
+        self.bundle = bundle
+        # Load spaCy now, so that the first assignment isn't slow
+        get_parser()
+        # The spaCy pipeline isn't safe to use from several threads at once
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_time_range(cls, time_range: ClusterTimeRange) -> "ClusterAssigner":
+        artifacts_dir = load_artifacts(time_range)
+        if artifacts_dir is None:
+            raise ValueError(f"No trained model for {time_range.name}")
+        return cls(load_model_bundle(artifacts_dir))
+
+    def assign(self, abstracts: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the cluster and the x and y coordinates of each abstract."""
+
+        if len(abstracts) == 0:
+            return np.array([], int), np.array([]), np.array([])
+
+        with self.lock:
+            X_reduced = self.vectorize(clean_abstracts(abstracts))
+            return self.assign_vectors(X_reduced)
+
+    def vectorize(self, clean_abstracts: list[str]) -> np.ndarray:
+        """Get the reduced vectors of the cleaned abstracts."""
+
+        X = self.bundle.vectorizer.transform(clean_abstracts)
+        return self.bundle.pca.transform(X.toarray())
+
+    def assign_vectors(
+        self, X_reduced: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the cluster and the x and y coordinates of each reduced vector."""
+
+        clusters = self.bundle.kmeans.predict(X_reduced)
+        neighbor_indices, _ = query_similarity_index(
+            self.bundle.similarity_index, X_reduced
+        )
+        positions = self.bundle.embeddings[neighbor_indices].mean(axis=1)
+
+        return clusters, positions[:, 0], positions[:, 1]
+
+
+class AssignmentBatcher:
+    """Collect the abstracts of concurrent requests into batches, which are
+    assigned together on a background thread."""
+
+    def __init__(
+        self,
+        assigner: ClusterAssigner,
+        max_batch_size: int = 64,
+        max_wait: float = 0.01,
+    ):
+        self.assigner = assigner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._assign_batches, daemon=True)
+        self.thread.start()
+
+    def assign(self, abstracts: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        future = Future()
+        self.queue.put((abstracts, future))
+        return future.result()
+
+    def _assign_batches(self):
+        while True:
+            requests = [self.queue.get()]
+            batch_size = len(requests[0][0])
+            # Wait a little for other requests to fill the batch
+            deadline = time.monotonic() + self.max_wait
+            while batch_size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                batch_size += len(request[0])
+
+            abstracts = [
+                abstract
+                for request_abstracts, _ in requests
+                for abstract in request_abstracts
+            ]
+            try:
+                clusters, x, y = self.assigner.assign(abstracts)
+            except Exception as error:
+                for _, future in requests:
+                    future.set_exception(error)
+                continue
+
+            offset = 0
+            for request_abstracts, future in requests:
+                end = offset + len(request_abstracts)
+                future.set_result((clusters[offset:end], x[offset:end], y[offset:end]))
+                offset = end
+
+
+def serve(batcher: AssignmentBatcher, port: int):
+    """Serve the cluster assignments on a local HTTP endpoint.
+    Expects a POST to /assign with {"abstracts": [...]}."""
+
+    class AssignmentHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/assign":
+                self.send_error(404)
+                return
+            try:
+                content_length = int(self.headers.get("Content-Length", 0))
+                abstracts = json.loads(self.rfile.read(content_length))["abstracts"]
+            except (ValueError, KeyError, TypeError):
+                abstracts = None
+            # The abstracts are assigned in batches with those of other
+            # requests, so invalid ones mustn't get that far
+            if not isinstance(abstracts, list) or not all(
+                isinstance(abstract, str) for abstract in abstracts
+            ):
+                self.send_error(400, 'Expected {"abstracts": ["...", ...]}')
+                return
+
+            try:
+                clusters, x, y = batcher.assign(abstracts)
+            except Exception as error:
+                print(f"Assigning the abstracts failed: {error!r}")
+                self.send_error(500, "Assigning the abstracts failed")
+                return
+            body = json.dumps(
+                {"cluster": clusters.tolist(), "x": x.tolist(), "y": y.tolist()}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), AssignmentHandler)
+    print(f"Serving cluster assignments on http://127.0.0.1:{port}/assign")
+    server.serve_forever()
+
+
+def get_benchmark_abstracts(count: int) -> list[str]:
+    """Get a sample of the scraped abstracts."""
+
+    project = hopsworks.login()
+    fs = project.get_feature_store()
+    df = (
+        fs.get_feature_group("acm_papers", 1)
+        .select(["abstract"])
+        .read(read_options={"use_hive": True})
+    )
+    return df["abstract"].sample(min(count, len(df)), random_state=42).tolist()
+
+
+def benchmark(
+    assigner: ClusterAssigner,
+    abstracts: list[str],
+    batch_sizes: tuple[int, ...] = (1, 8, 32, 128),
+):
+    """Print the latency and the throughput of the assignments per batch size."""
+
+    # Warm up
+    assigner.assign(abstracts[:1])
+
+    for batch_size in batch_sizes:
+        latencies = []
+        start_time = time.perf_counter()
+        for start in range(0, len(abstracts), batch_size):
+            batch_start_time = time.perf_counter()
+            assigner.assign(abstracts[start : start + batch_size])
+            latencies.append(time.perf_counter() - batch_start_time)
+        duration = time.perf_counter() - start_time
+        print(
+            f"Batch size {batch_size}: "
+            f"p50 latency {np.percentile(latencies, 50) * 1000:.1f} ms, "
+            f"p95 latency {np.percentile(latencies, 95) * 1000:.1f} ms, "
+            f"{len(abstracts) / duration:.1f} papers/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Assign new papers to the clusters of a trained model."
+    )
+    parser.add_argument(
+        "--time-range",
+        choices=[time_range.name.lower() for time_range in ClusterTimeRange],
+        default="last_year",
+    )
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--benchmark", type=int, metavar="PAPERS_COUNT")
+    args = parser.parse_args()
+
+    assigner = ClusterAssigner.from_time_range(
+        ClusterTimeRange[args.time_range.upper()]
+    )
+    if args.benchmark:
+        benchmark(assigner, get_benchmark_abstracts(args.benchmark))
+    if args.serve:
+        serve(AssignmentBatcher(assigner), args.port)
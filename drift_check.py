@@ -0,0 +1,167 @@
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import TfidfVectorizer
+from model.drift_decision import DriftDecision
+
+# Above this share of new papers, the clusters are refitted anyway
+MAX_NEW_PAPERS_FRACTION = 0.5
+# Above this share of training papers that left the time range, too
+MAX_EXPIRED_PAPERS_FRACTION = 0.5
+# Share of new papers farther from their centroid than 95% of the training papers
+MAX_OUTLIERS_FRACTION = 0.2
+# Increase of the share of words that the vectorizer doesn't know
+MAX_OOV_RATE_INCREASE = 0.1
+# Shift of a centroid by the new papers, relative to the closest two centroids
+MAX_CENTROID_SHIFT = 0.25
+
+
+def get_oov_rate(vectorizer: TfidfVectorizer, clean_abstracts: list[str]) -> float:
+    """Get the share of words in the abstracts that are not in the vocabulary."""
+
+    analyzer = vectorizer.build_analyzer()
+    words_count = 0
+    oov_words_count = 0
+    for clean_abstract in clean_abstracts:
+        words = analyzer(clean_abstract)
+        words_count += len(words)
+        oov_words_count += sum(word not in vectorizer.vocabulary_ for word in words)
+
+    return oov_words_count / max(words_count, 1)
+
+
+def get_assignment_distances(kmeans: KMeans, X_reduced: np.ndarray) -> np.ndarray:
+    """Get the distance of each vector to its closest centroid."""
+
+    return kmeans.transform(X_reduced).min(axis=1)
+
+
+def get_centroid_spacing(kmeans: KMeans) -> float:
+    """Get the distance between the closest two centroids."""
+
+    centroids = kmeans.cluster_centers_
+    distances = np.linalg.norm(centroids[:, None] - centroids[None, :], axis=-1)
+    np.fill_diagonal(distances, np.inf)
+    return float(distances.min())
+
+
+def get_drift_reference(
+    vectorizer: TfidfVectorizer,
+    kmeans: KMeans,
+    X_reduced: np.ndarray,
+    clean_abstracts: list[str],
+) -> dict:
+    """Get the statistics of the training papers, that new papers are compared with."""
+
+    distances = get_assignment_distances(kmeans, X_reduced)
+    return {
+        "distance_p95": float(np.percentile(distances, 95)),
+        "oov_rate": get_oov_rate(vectorizer, clean_abstracts),
+        "centroid_spacing": get_centroid_spacing(kmeans),
+        "cluster_sizes": np.bincount(
+            kmeans.predict(X_reduced), minlength=kmeans.n_clusters
+        ).tolist(),
+    }
+
+
+def get_max_centroid_shift(
+    kmeans: KMeans, X_new: np.ndarray, new_clusters: np.ndarray, cluster_sizes: list
+) -> float:
+    """Estimate how far the new papers would move the centroids,
+    if they were added to their clusters."""
+
+    max_shift = 0.0
+    for cluster, centroid in enumerate(kmeans.cluster_centers_):
+        X_cluster = X_new[new_clusters == cluster]
+        if len(X_cluster) == 0:
+            continue
+        weight = len(X_cluster) / (cluster_sizes[cluster] + len(X_cluster))
+        shift = weight * np.linalg.norm(X_cluster.mean(axis=0) - centroid)
+        max_shift = max(max_shift, shift)
+
+    return float(max_shift)
+
+
+def check_paper_counts(
+    papers_count: int,
+    new_papers_count: int,
+    expired_papers_count: int,
+    model_papers_count: int,
+) -> tuple[DriftDecision | None, dict]:
+    """Decide from the numbers of new and expired papers alone, before the new
+    papers are cleaned and vectorized. Returns None as the decision if the new
+    papers have to be compared with the trained model with check_drift.
+    The reason of the decision is part of the metrics."""
+
+    metrics = {
+        "papers_count": papers_count,
+        "new_papers_count": new_papers_count,
+        "expired_papers_count": expired_papers_count,
+        "new_papers_fraction": new_papers_count / max(papers_count, 1),
+        "expired_papers_fraction": expired_papers_count / max(model_papers_count, 1),
+        "outliers_fraction": 0.0,
+        "oov_rate": 0.0,
+        "centroid_shift": 0.0,
+        "reason": "",
+    }
+
+    if new_papers_count == 0 and expired_papers_count == 0:
+        metrics["reason"] = "no new or expired papers"
+        return DriftDecision.NO_CHANGE, metrics
+    if model_papers_count == 0:
+        metrics["reason"] = "no saved model"
+        return DriftDecision.FULL_REFIT, metrics
+    reasons = []
+    if metrics["new_papers_fraction"] > MAX_NEW_PAPERS_FRACTION:
+        reasons.append("too many new papers")
+    if metrics["expired_papers_fraction"] > MAX_EXPIRED_PAPERS_FRACTION:
+        reasons.append("too many expired papers")
+    if reasons:
+        metrics["reason"] = ", ".join(reasons)
+        return DriftDecision.FULL_REFIT, metrics
+
+    return None, metrics
+
+
+def check_drift(
+    vectorizer: TfidfVectorizer,
+    kmeans: KMeans,
+    drift_reference: dict,
+    X_new: np.ndarray,
+    new_clean_abstracts: list[str],
+    metrics: dict,
+) -> tuple[DriftDecision, dict]:
+    """Decide whether the clusters have to be refitted for the new papers,
+    from cheap statistics of the new papers against the trained model.
+    The metrics are the ones of check_paper_counts, which found no reason
+    to refit from the numbers of papers alone."""
+
+    metrics = dict(metrics)
+    if len(X_new) > 0:
+        distances = get_assignment_distances(kmeans, X_new)
+        metrics["outliers_fraction"] = float(
+            np.mean(distances > drift_reference["distance_p95"])
+        )
+        metrics["oov_rate"] = get_oov_rate(vectorizer, new_clean_abstracts)
+        metrics["centroid_shift"] = (
+            get_max_centroid_shift(
+                kmeans,
+                X_new,
+                kmeans.predict(X_new),
+                drift_reference["cluster_sizes"],
+            )
+            / drift_reference["centroid_spacing"]
+        )
+
+    reasons = []
+    if metrics["outliers_fraction"] > MAX_OUTLIERS_FRACTION:
+        reasons.append("too many outliers")
+    if metrics["oov_rate"] > drift_reference["oov_rate"] + MAX_OOV_RATE_INCREASE:
+        reasons.append("too many unknown words")
+    if metrics["centroid_shift"] > MAX_CENTROID_SHIFT:
+        reasons.append("centroids would shift")
+    if reasons:
+        metrics["reason"] = ", ".join(reasons)
+        return DriftDecision.FULL_REFIT, metrics
+
+    metrics["reason"] = "the new papers fit the model"
+    return DriftDecision.INCREMENTAL_UPDATE, metrics
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+# Compact types of the columns read from the feature groups.
+# Arrow-backed strings are stored in one buffer per column instead of
+# one Python object per value.
+COMPACT_DTYPES = {
+    "citation": "string[pyarrow]",
+    "abstract": "string[pyarrow]",
+    "publication_date": "string[pyarrow]",
+    "similar_papers": "string[pyarrow]",
+    "keywords": "string[pyarrow]",
+    "x_coord": np.float32,
+    "y_coord": np.float32,
+}
+
+
+def get_memory_usage(df: pd.DataFrame) -> float:
+    """Get the memory used by the data frame in MB, including the strings."""
+
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def to_compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the columns of the data frame to their compact types.
+    The cluster labels become an ordered categorical, so they can still be
+    compared and their minimum and maximum taken."""
+
+    memory_before = get_memory_usage(df)
+    df = df.astype(
+        {
+            column: dtype
+            for column, dtype in COMPACT_DTYPES.items()
+            if column in df.columns
+        }
+    )
+    if "cluster" in df.columns:
+        df["cluster"] = df["cluster"].astype(
+            pd.CategoricalDtype(np.sort(df["cluster"].unique()), ordered=True)
+        )
+    print(
+        f"Read {len(df)} rows: {memory_before:.2f} MB, "
+        f"{get_memory_usage(df):.2f} MB with compact types"
+    )
+    return df
+
+
+def read_compact(query) -> pd.DataFrame:
+    """Read the query of a feature group with compact types.
+    The query should select only the columns that are needed."""
+
+    df = query.read(read_options={"use_hive": True})
+    return to_compact_dtypes(df)
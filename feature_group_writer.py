@@ -0,0 +1,95 @@
+import pandas as pd
+from hsfs import feature_group as fg
+
+
+def parse_publication_dates(publication_dates: pd.Series) -> pd.Series:
+    """Convert the publication dates to date objects.
+    For some reason, the publication_date column is not read as a date column."""
+
+    return pd.to_datetime(publication_dates, format="%Y-%m-%d").dt.date
+
+
+# Floats are compared with the precision of the coordinates of the map tiles
+FLOAT_DECIMALS = 4
+
+
+def get_row_hashes(df: pd.DataFrame, columns: list[str]) -> pd.Series:
+    """Hash the values of the provided columns of each row.
+    The floats are rounded, so that rounding errors don't count as changes."""
+
+    values = df[columns].copy()
+    float_columns = values.select_dtypes("floating").columns
+    values[float_columns] = values[float_columns].round(FLOAT_DECIMALS)
+    return pd.util.hash_pandas_object(values, index=False)
+
+
+def read_snapshot(feature_group: fg.FeatureGroup) -> pd.DataFrame | None:
+    """Read the stored rows of the feature group, or None if it was just created."""
+
+    if feature_group.id is None:
+        return None
+    return feature_group.read(read_options={"use_hive": True})
+
+
+def upsert_feature_group(
+    feature_group: fg.FeatureGroup,
+    df: pd.DataFrame,
+    primary_key: str,
+):
+    """Write only the rows that differ from the stored snapshot of the feature group.
+    New and changed rows are upserted by the primary key, and the rows
+    that are not in the provided data frame anymore are deleted.
+    A full refit moves nearly all papers on the map, so this mostly saves
+    writes when the clusters are updated without refitting."""
+
+    snapshot_df = read_snapshot(feature_group)
+
+    if snapshot_df is None:
+        feature_group.insert(df)
+        print(f"{feature_group.name}: all {len(df)} rows written")
+        return
+    if set(snapshot_df.columns) != set(df.columns):
+        # The schema of a feature group version can't change, not even by
+        # overwriting it, so the columns need a new version of the feature group
+        missing_columns = sorted(set(snapshot_df.columns) - set(df.columns))
+        new_columns = sorted(set(df.columns) - set(snapshot_df.columns))
+        raise ValueError(
+            f"The columns of {feature_group.name} version {feature_group.version} "
+            f"don't match: missing {missing_columns}, new {new_columns}. "
+            "Create a new version of the feature group for the new columns."
+        )
+
+    columns = list(df.columns)
+    snapshot_df = snapshot_df[columns].copy()
+    if "publication_date" in columns:
+        snapshot_df["publication_date"] = parse_publication_dates(
+            snapshot_df["publication_date"]
+        )
+    # Compare the values with the same types as the new data
+    snapshot_df = snapshot_df.astype(df.dtypes.to_dict())
+
+    snapshot_hashes = pd.Series(
+        get_row_hashes(snapshot_df, columns).values,
+        index=snapshot_df[primary_key].values,
+    )
+    new_hashes = pd.Series(
+        get_row_hashes(df, columns).values, index=df[primary_key].values
+    )
+    stored_hashes = snapshot_hashes.reindex(new_hashes.index)
+    is_changed = (stored_hashes != new_hashes).values
+    is_removed = ~snapshot_df[primary_key].isin(df[primary_key]).values
+
+    changed_df = df[is_changed]
+    removed_df = snapshot_df[is_removed]
+
+    if len(changed_df) > 0:
+        feature_group.insert(changed_df)
+    if len(removed_df) > 0:
+        feature_group.commit_delete_record(removed_df)
+
+    changed_memory_usage = changed_df.memory_usage(deep=True).sum()
+    print(
+        f"{feature_group.name}: {len(changed_df)} of {len(df)} rows upserted "
+        f"({changed_memory_usage / 2**20:.2f} MB in memory), "
+        f"{len(removed_df)} rows deleted"
+    )
@@ -0,0 +1,129 @@
+import numpy as np
+from pynndescent import NNDescent
+from scipy import sparse
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors, sort_graph_by_row_values
+
+random_seed = 42
+
+
+def get_knn_neighbors_count(perplexity: int) -> int:
+    """Get the number of neighbours t-SNE needs for the perplexity,
+    including the paper itself."""
+
+    # Same as t-SNE, which uses 3 * perplexity + 1 neighbours besides the paper
+    return int(3 * perplexity + 1) + 1
+
+
+def get_knn_graph(index: NNDescent) -> sparse.csr_matrix:
+    """Get the neighbour graph computed while building the index as a sparse
+    matrix, with the distance to each neighbour of each paper.
+    Each row also stores the paper itself, with distance 0."""
+
+    neighbor_indices, neighbor_distances = index.neighbor_graph
+    papers_count, neighbors_count = neighbor_indices.shape
+    # NN-descent marks the neighbours it couldn't find with -1
+    is_found = neighbor_indices >= 0
+    rows = np.repeat(np.arange(papers_count), neighbors_count)[is_found.ravel()]
+    knn_graph = sparse.csr_matrix(
+        (
+            neighbor_distances[is_found].astype(np.float64),
+            (rows, neighbor_indices[is_found]),
+        ),
+        shape=(papers_count, papers_count),
+    )
+    # Each row is sorted by distance, as the neighbour searches expect
+    return sort_graph_by_row_values(knn_graph, warn_when_not_sorted=False)
+
+
+def get_2d_embeddings_from_knn_graph(
+    knn_graph: sparse.csr_matrix, perplexity: float
+) -> np.ndarray:
+    """Get the 2D embeddings with t-SNE from the precomputed neighbour graph,
+    instead of letting t-SNE search the neighbours again. The perplexity is
+    lowered if the graph has fewer neighbours than it needs, which happens
+    when there are only a few papers."""
+
+    # t-SNE needs int(3 * perplexity + 1) neighbours of each paper besides
+    # the paper itself, and each row of the graph stores the paper too
+    neighbors_count = int(np.diff(knn_graph.indptr).min())
+    max_perplexity = (neighbors_count - 2) / 3
+    if perplexity > max_perplexity:
+        print(
+            f"Only {neighbors_count - 1} neighbours per paper, "
+            f"lowering the perplexity from {perplexity} to {max_perplexity:.1f}"
+        )
+        perplexity = max_perplexity
+
+    # t-SNE expects squared euclidean distances
+    squared_knn_graph = knn_graph.copy()
+    squared_knn_graph.data **= 2
+    # PCA initialisation needs the vectors, which t-SNE doesn't get here
+    tsne = TSNE(
+        verbose=1,
+        perplexity=perplexity,
+        metric="precomputed",
+        init="random",
+        random_state=random_seed,
+    )
+    return tsne.fit_transform(squared_knn_graph)
+
+
+def get_neighbor_lists(knn_graph: sparse.csr_matrix) -> list[np.ndarray]:
+    """Get the neighbours of each paper sorted by distance, without the paper itself."""
+
+    neighbor_lists = []
+    for paper_index in range(knn_graph.shape[0]):
+        start, end = knn_graph.indptr[paper_index], knn_graph.indptr[paper_index + 1]
+        neighbors = knn_graph.indices[start:end]
+        neighbor_lists.append(neighbors[neighbors != paper_index])
+    return neighbor_lists
+
+
+def get_cluster_purity(
+    knn_graph: sparse.csr_matrix, clusters: np.ndarray
+) -> list[float]:
+    """Get the share of the neighbours that are in the same cluster, for each cluster."""
+
+    rows = np.repeat(np.arange(knn_graph.shape[0]), np.diff(knn_graph.indptr))
+    is_neighbor = rows != knn_graph.indices
+    is_same_cluster = clusters[rows] == clusters[knn_graph.indices]
+
+    purity = []
+    for cluster in range(int(clusters.max()) + 1):
+        in_cluster = is_neighbor & (clusters[rows] == cluster)
+        purity.append(
+            float(is_same_cluster[in_cluster].mean()) if in_cluster.any() else 0.0
+        )
+    return purity
+
+
+def get_neighborhood_preservation(
+    knn_graph: sparse.csr_matrix, X_embedded: np.ndarray, k: int = 10
+) -> float:
+    """Get the share of the k nearest neighbours of each paper that are also
+    among its k nearest neighbours on the 2D map."""
+
+    neighbor_lists = get_neighbor_lists(knn_graph)
+    k = min(k, min(len(neighbors) for neighbors in neighbor_lists))
+    # Neighbours in 2D are cheap to find with a tree
+    embedded_neighbors = NearestNeighbors(n_neighbors=k).fit(X_embedded)
+    embedded_indices = embedded_neighbors.kneighbors(return_distance=False)
+
+    preserved_count = 0
+    for neighbors, embedded in zip(neighbor_lists, embedded_indices):
+        preserved_count += len(np.intersect1d(neighbors[:k], embedded))
+    return preserved_count / (k * len(neighbor_lists))
+
+
+def print_quality_metrics(
+    knn_graph: sparse.csr_matrix, clusters: np.ndarray, X_embedded: np.ndarray
+):
+    """Print the cluster purity and the neighbourhood preservation of the map."""
+
+    purity = get_cluster_purity(knn_graph, clusters)
+    for cluster, cluster_purity in enumerate(purity):
+        print(f"Cluster {cluster} neighbour purity: {cluster_purity:.2f}")
+    print(f"Mean neighbour purity: {sum(purity) / max(len(purity), 1):.2f}")
+    preservation = get_neighborhood_preservation(knn_graph, X_embedded)
+    print(f"Neighbourhood preservation of the 2D map: {preservation:.2f}")
@@ -1,11 +1,15 @@
 from datetime import date, timedelta
 from enum import Enum
 
+# The ACM Digital Library doesn't have papers before this date
+ALL_TIME_START_DATE = date(1950, 1, 1)
+
 
 class ClusterTimeRange(Enum):
     LAST_MONTH = 1
     LAST_HALF_YEAR = 2
     LAST_YEAR = 3
+    ALL_TIME = 4
 
     def get_start_date(self) -> date:
         """Get the start date for the provided time range."""
@@ -31,6 +35,8 @@ class ClusterTimeRange(Enum):
                 start_date = today.replace(month=today.month - 6, day=1)
         elif self == ClusterTimeRange.LAST_YEAR:
             start_date = today.replace(year=today.year - 1, day=1)
+        elif self == ClusterTimeRange.ALL_TIME:
+            start_date = ALL_TIME_START_DATE
 
         return start_date
 
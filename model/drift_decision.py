@@ -0,0 +1,10 @@
+from enum import Enum
+
+
+class DriftDecision(Enum):
+    # the new papers changed the clusters, the whole pipeline is run
+    FULL_REFIT = 1
+    # the new papers are assigned to the existing clusters
+    INCREMENTAL_UPDATE = 2
+    # nothing has changed since the last training
+    NO_CHANGE = 3
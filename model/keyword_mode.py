@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class KeywordMode(Enum):
+    # LDA topics fitted separately for each cluster
+    LDA = 1
+    # class-based TF-IDF computed for all clusters at once
+    CLASS_TFIDF = 2
@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+import numpy as np
+from pynndescent import NNDescent
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+@dataclass
+class ModelBundle:
+    vectorizer: TfidfVectorizer
+    pca: PCA
+    kmeans: KMeans
+    similarity_index: NNDescent
+    # 2D embeddings and citations of the indexed papers
+    embeddings: np.ndarray
+    citations: list[str]
+    # statistics of the training papers, to compare new papers with
+    drift_reference: dict
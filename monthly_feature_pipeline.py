@@ -4,14 +4,36 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    StaleElementReferenceException,
+    TimeoutException as SeleniumTimeoutException,
+    WebDriverException,
+)
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Callable
+import itertools
+import queue
+import re
+import threading
 import time
 import hopsworks
 from hsfs import feature_group as fg
 import pandas as pd
 import os
+from paper_key import get_doi_from_citation
+from request_scheduler import (
+    RETRYABLE_ERRORS,
+    RequestScheduler,
+    ServerError,
+    ThrottledError,
+)
 
 is_ci_env = os.getenv("GITHUB_ACTIONS") == "true"
 
+# Each Chrome instance needs its own debugging port
+debugging_ports = itertools.count(9222)
+
 
 def initialize_feature_group():
     project = hopsworks.login()
@@ -20,11 +42,11 @@ def initialize_feature_group():
     return acm_papers_fg
 
 
-def initialize_driver() -> webdriver.Remote:
+def initialize_driver(page_load_timeout: float = 30) -> webdriver.Remote:
     if is_ci_env:
         service = Service(executable_path="/usr/local/bin/chromedriver")
         chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--remote-debugging-port=9222")
+        chrome_options.add_argument(f"--remote-debugging-port={next(debugging_ports)}")
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--headless")
         driver = webdriver.Chrome(service=service, options=chrome_options)
@@ -32,24 +54,59 @@ def initialize_driver() -> webdriver.Remote:
         chrome_options = webdriver.ChromeOptions()
         chrome_options.add_argument("--headless")
         driver = webdriver.Chrome(options=chrome_options)
+    driver.set_page_load_timeout(page_load_timeout)
     return driver
 
 
-def get_past_month_search_link():
-    # Get the current date
-    today = date.today()
-    # Get the first day of the previous month
-    if today.month == 1:
-        first_day_of_previous_month = today.replace(
-            year=today.year - 1, month=12, day=1
-        )
-    else:
-        first_day_of_previous_month = today.replace(month=today.month - 1, day=1)
-    # Get the search link for the past month
-    start_date = first_day_of_previous_month
-    end_date = today.replace(day=1) - timedelta(days=1)
+class DriverPool:
+    """Give each scraping thread its own driver, and quit all of them at the end."""
+
+    def __init__(self, page_load_timeout: float):
+        self.page_load_timeout = page_load_timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.drivers = []
+
+    def get(self) -> webdriver.Remote:
+        if not hasattr(self.local, "driver"):
+            self.local.driver = initialize_driver(self.page_load_timeout)
+            with self.lock:
+                self.drivers.append(self.local.driver)
+        return self.local.driver
+
+    def close(self):
+        for driver in self.drivers:
+            driver.quit()
+
+
+def check_page_status(driver: webdriver.Remote):
+    """Raise if the loaded page is a rate limiting or server error page
+    instead of the requested one."""
+
+    title = driver.title.lower()
+    if "too many requests" in title or "just a moment" in title:
+        raise ThrottledError(title)
+    # e.g. "502 Bad Gateway" or "Service Unavailable"
+    if re.match(r"5\d\d\b", title) or any(
+        error in title
+        for error in ("internal server error", "bad gateway", "service unavailable")
+    ):
+        raise ServerError(title)
+
+
+def load_page(driver: webdriver.Remote, page_link: str):
+    """Load the page. Raises one of the errors the scheduler retries
+    if the page times out or the site is overloaded."""
+
+    try:
+        driver.get(page_link)
+    except SeleniumTimeoutException as error:
+        raise TimeoutError(f"Loading {page_link} timed out") from error
+    check_page_status(driver)
+
+
+def get_search_link(start_date: date, end_date: date, start_page: int = 0) -> str:
     page_size = 50
-    start_page = 0
     search_link = (
         "https://dl.acm.org/topic/ccs2012/10010147.10010257.10010258.10010259.10010263?expand=all&EpubDate=%5B"
         + start_date.strftime("%Y%m%d")
@@ -64,6 +121,22 @@ def get_past_month_search_link():
     return search_link
 
 
+def get_past_month_search_link():
+    # Get the current date
+    today = date.today()
+    # Get the first day of the previous month
+    if today.month == 1:
+        first_day_of_previous_month = today.replace(
+            year=today.year - 1, month=12, day=1
+        )
+    else:
+        first_day_of_previous_month = today.replace(month=today.month - 1, day=1)
+    # Get the search link for the past month
+    start_date = first_day_of_previous_month
+    end_date = today.replace(day=1) - timedelta(days=1)
+    return get_search_link(start_date, end_date)
+
+
 class Paper:
     def __init__(self, abstract: str, publication_date: date, citation: str):
         self.abstract = abstract
@@ -86,6 +159,119 @@ def save_papers_to_feature_group(feature_group: fg.FeatureGroup, papers: list[Pa
     print("Papers saved to feature group!")
 
 
+class BufferedPaperWriter:
+    """Save papers to the feature group on a background thread, so that
+    scraping continues while a batch is being inserted. Papers are coalesced
+    into batches by row count or size, and writing blocks when too many papers
+    are waiting to be saved. Each written paper gets a future, which is done
+    once the batch it is in is saved. Closing the writer saves the remaining papers."""
+
+    _FLUSH = object()
+    _CLOSE = object()
+
+    def __init__(
+        self,
+        feature_group: fg.FeatureGroup,
+        max_batch_rows: int = 500,
+        max_batch_bytes: int = 8 * 2**20,
+        max_queued_papers: int = 1000,
+        flush_interval: float = 60,
+    ):
+        self.feature_group = feature_group
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queued_papers)
+        self.error = None
+        self.thread = threading.Thread(target=self._save_batches, daemon=True)
+        self.thread.start()
+
+    def write(self, paper: Paper) -> Future:
+        """Queue the paper to be saved. The returned future is done once the
+        paper is saved, or has the error if saving it failed."""
+        self._raise_error()
+        saved = Future()
+        self.queue.put((paper, saved))
+        return saved
+
+    def flush(self):
+        """Save the written papers without waiting for a full batch.
+        Returns right away, the futures of the papers tell when they are saved."""
+        self.queue.put(self._FLUSH)
+
+    def close(self):
+        self.queue.put(self._CLOSE)
+        self.thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Don't hide the exception that stopped the scraping
+        try:
+            self.close()
+        except Exception as error:
+            print(f"Saving the remaining papers failed: {error!r}")
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("Saving papers failed") from self.error
+
+    def _save_batches(self):
+        batch = []
+        batch_bytes = 0
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # Save the papers that have been waiting for a while
+                if batch:
+                    self._save_batch(batch)
+                    batch = []
+                    batch_bytes = 0
+                continue
+
+            if item is self._FLUSH or item is self._CLOSE:
+                if batch:
+                    self._save_batch(batch)
+                    batch = []
+                    batch_bytes = 0
+            else:
+                paper, _ = item
+                batch.append(item)
+                batch_bytes += len(paper.abstract) + len(paper.citation)
+                if (
+                    len(batch) >= self.max_batch_rows
+                    or batch_bytes >= self.max_batch_bytes
+                ):
+                    self._save_batch(batch)
+                    batch = []
+                    batch_bytes = 0
+
+            if item is self._CLOSE:
+                return
+
+    def _save_batch(self, batch: list[tuple[Paper, Future]]):
+        # After a failure, the remaining papers are dropped, the error is
+        # raised on the scraping thread and set on their futures instead
+        if self.error is None:
+            try:
+                save_papers_to_feature_group(
+                    self.feature_group, [paper for paper, _ in batch]
+                )
+            except Exception as error:
+                self.error = error
+        for _, saved in batch:
+            if self.error is None:
+                saved.set_result(None)
+            else:
+                saved.set_exception(self.error)
+
+
 def get_abstract_on_paper_page(driver: webdriver.Remote) -> str:
     abstract = (
         WebDriverWait(driver, 10)
@@ -132,22 +318,103 @@ def get_citation_on_paper_page(driver: webdriver.Remote) -> str:
         .until(EC.visibility_of_element_located((By.CLASS_NAME, "csl-right-inline")))
         .text
     )
-    return citation
+    return normalize_citation(citation)
 
 
-def get_paper_on_paper_page(driver: webdriver.Remote) -> Paper:
+def get_paper_on_paper_page(
+    driver: webdriver.Remote, citation: str | None = None
+) -> Paper:
     # Get necessary information
     abstract: str = get_abstract_on_paper_page(driver)
     publication_date: date = get_publication_date_on_paper_page(driver)
-    citation: str = get_citation_on_paper_page(driver)
+    if citation is None:
+        # The citation wasn't exported from the search page
+        citation = get_citation_on_paper_page(driver)
     paper = Paper(abstract, publication_date, citation)
 
     return paper
 
 
+def normalize_citation(citation: str) -> str:
+    """Normalize the line endings and the whitespace around a citation.
+    The citation is the primary key of the papers, so the citations of the paper
+    pages and of the search page exports have to go through this.
+    The visible text of a page is already normalized like this,
+    so the citations that are already stored don't change."""
+
+    return citation.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def get_doi_from_paper_link(paper_link: str) -> str | None:
+    # expected format: https://dl.acm.org/doi/10.1145/3583780.3614892,
+    # optionally with abs/, full/, book/ or pdf/ before the DOI
+    match = re.search(r"/doi/(?:abs/|full/|book/|pdf/)?(10\.[^?#]+)", paper_link)
+    return match.group(1).lower() if match else None
+
+
+def get_citations_on_search_page(
+    driver: webdriver.Remote, papers_count: int
+) -> dict[str, str]:
+    """Export the citations of all papers on the search page at once.
+    Returns the citations by DOI, or an empty dictionary if the export fails
+    or doesn't contain a citation for each of the papers on the page."""
+
+    def get_rendered_citations(driver: webdriver.Remote) -> list[str] | bool:
+        # The export is rendered gradually, wait until all citations have text
+        citation_elements = driver.find_elements(By.CLASS_NAME, "csl-right-inline")
+        citations = [citation_element.text for citation_element in citation_elements]
+        return len(citations) >= papers_count and all(citations) and citations
+
+    try:
+        select_all_checkbox = WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'input[name="markall"]'))
+        )
+        driver.execute_script("arguments[0].click();", select_all_checkbox)
+        # Waiting for the button to be clickable replaces the fixed delay of the
+        # paper pages, where clicking too early redirects to the homepage
+        export_citations_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable(
+                (
+                    By.CSS_SELECTOR,
+                    'a[aria-label="Export Citations"], a[data-title="Export Citations"]',
+                )
+            )
+        )
+        driver.execute_script("arguments[0].click();", export_citations_button)
+        rendered_citations = WebDriverWait(
+            driver, 30, ignored_exceptions=[StaleElementReferenceException]
+        ).until(get_rendered_citations)
+    except WebDriverException as error:
+        print(f"Exporting the citations failed ({type(error).__name__})")
+        return {}
+
+    citations = {}
+    for citation in rendered_citations:
+        citation = normalize_citation(citation)
+        doi = get_doi_from_citation(citation)
+        if doi is not None:
+            citations[doi] = citation
+    if len(citations) != papers_count:
+        print(
+            f"Exported {len(citations)} citations for {papers_count} papers, "
+            "not using the export"
+        )
+        return {}
+    print(f"Citations exported: {len(citations)}")
+
+    return citations
+
+
 def scrape_papers_on_search_page(
-    driver: webdriver.Remote, feature_group: fg.FeatureGroup
-):
+    driver: webdriver.Remote,
+    writer: BufferedPaperWriter,
+    scheduler: RequestScheduler,
+    driver_pool: DriverPool,
+    executor: ThreadPoolExecutor,
+) -> list[Future]:
+    """Scrape the papers of the loaded search page.
+    Returns the futures of the written papers, which are done once they are saved."""
+
     print(f"Scraping papers on search page: {driver.current_url}")
 
     # Get all search results
@@ -160,37 +427,112 @@ def scrape_papers_on_search_page(
         title_span = search_result.find_element(By.CLASS_NAME, "issue-item__title")
         paper_link = title_span.find_element(By.TAG_NAME, "a").get_attribute("href")
         paper_links.append(paper_link)
-    # Scrape each paper
-    papers = []
-    for paper_link in paper_links:
+    # Export the citations of all papers in one request, instead of one per paper
+    citations = scheduler.call(
+        lambda: get_citations_on_search_page(driver, len(paper_links))
+    )
+
+    saved_papers = []
+
+    def scrape_paper(paper_link: str, citation: str | None) -> Paper | None:
+        def request() -> Paper:
+            # The driver is started within the slot of the request, so the
+            # number of running browsers is bounded by the concurrency limit
+            paper_driver = driver_pool.get()
+            load_page(paper_driver, paper_link)
+            # A missing element isn't retried, the page won't have it next time
+            return get_paper_on_paper_page(paper_driver, citation)
+
         print(f"Scraping paper on paper page: {paper_link}")
-        driver.get(paper_link)
-        paper = get_paper_on_paper_page(driver)
+        try:
+            paper = scheduler.call(request)
+        except (WebDriverException, *RETRYABLE_ERRORS) as error:
+            # A single broken page shouldn't stop the whole run
+            print(f"Skipping paper {paper_link}: {type(error).__name__}")
+            return None
         print(f"Paper scraped: {paper_link}")
-        papers.append(paper)
-    # Save the papers
-    save_papers_to_feature_group(feature_group, papers)
+        saved_papers.append(writer.write(paper))
+        return paper
 
+    if citations:
+        # Check the export against the citation of a paper page first. The
+        # citation is the primary key, so a different text would duplicate
+        # the papers that were scraped before. It is scraped on the executor
+        # too, so that only its threads start browsers for the paper pages.
+        checked_link = paper_links[0]
+        paper = executor.submit(scrape_paper, checked_link, None).result()
+        exported_citation = citations.get(get_doi_from_paper_link(checked_link))
+        if paper is None or paper.citation != exported_citation:
+            print("The exported citations can't be checked or differ, not using them")
+            citations = {}
+        paper_links = paper_links[1:]
 
-def scrape_papers_by_search_link(search_link: str, feature_group: fg.FeatureGroup):
-    driver: webdriver.Remote = initialize_driver()
+    # Scrape the papers concurrently, the writer saves them in the background
+    list(
+        executor.map(
+            lambda paper_link: scrape_paper(
+                paper_link, citations.get(get_doi_from_paper_link(paper_link))
+            ),
+            paper_links,
+        )
+    )
+    return saved_papers
 
-    current_page = search_link
-    while current_page is not None:
-        driver.get(current_page)
-        scrape_papers_on_search_page(driver, feature_group)
-        # Go back to the search page
-        driver.get(current_page)
-        try:
-            # Go to the next page
-            next_page = driver.find_element(By.CLASS_NAME, "pagination__btn--next")
-            current_page = next_page.get_attribute("href")
-        except:
-            # No more pages
-            current_page = None
+
+def scrape_papers_by_search_link(
+    search_link: str,
+    writer: BufferedPaperWriter,
+    scheduler: RequestScheduler | None = None,
+    on_page_scraped: Callable[[str | None, list[Future]], None] | None = None,
+    driver_pool: DriverPool | None = None,
+    executor: ThreadPoolExecutor | None = None,
+):
+    """Scrape the papers of all search pages, starting from the search link.
+    on_page_scraped is called with the link of the next page (None after the
+    last page) and the futures of the papers of the page, which are done once
+    the papers are saved. The paper pages are scraped on the executor with the
+    drivers of the driver pool, which can be shared by concurrent calls.
+    By default, they are created for this call."""
+
+    if scheduler is None:
+        scheduler = RequestScheduler()
+
+    with ExitStack() as stack:
+        stack.callback(lambda: print(f"Scraping finished: {scheduler.summary()}"))
+        if driver_pool is None:
+            driver_pool = DriverPool(scheduler.timeout)
+            stack.callback(driver_pool.close)
+        if executor is None:
+            executor = stack.enter_context(
+                ThreadPoolExecutor(max_workers=scheduler.max_concurrency)
+            )
+        # The search pages are loaded on this thread, with its own driver
+        search_driver_pool = DriverPool(scheduler.timeout)
+        stack.callback(search_driver_pool.close)
+
+        def load_search_page(page_link: str):
+            load_page(search_driver_pool.get(), page_link)
+
+        current_page = search_link
+        while current_page is not None:
+            scheduler.call(lambda: load_search_page(current_page))
+            driver = search_driver_pool.get()
+            saved_papers = scrape_papers_on_search_page(
+                driver, writer, scheduler, driver_pool, executor
+            )
+            try:
+                # Go to the next page
+                next_page = driver.find_element(By.CLASS_NAME, "pagination__btn--next")
+                current_page = next_page.get_attribute("href")
+            except:
+                # No more pages
+                current_page = None
+            if on_page_scraped is not None:
+                on_page_scraped(current_page, saved_papers)
 
 
 if __name__ == "__main__":
     feature_group = initialize_feature_group()
     search_link = get_past_month_search_link()
-    scrape_papers_by_search_link(search_link, feature_group)
+    with BufferedPaperWriter(feature_group) as writer:
+        scrape_papers_by_search_link(search_link, writer)
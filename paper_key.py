@@ -0,0 +1,17 @@
+import hashlib
+import re
+
+
+def get_doi_from_citation(citation: str) -> str | None:
+    match = re.search(r"doi\s*=\s*{([^{}]*)}", citation, re.IGNORECASE)
+    return match.group(1).strip().lower() if match else None
+
+
+def get_paper_key(citation: str) -> str:
+    """Get a short key of the paper, that other rows can refer to it by instead
+    of its whole citation: its DOI, or a hash of the citation if it has none."""
+
+    doi = get_doi_from_citation(citation)
+    if doi is not None:
+        return doi
+    return hashlib.sha256(citation.encode()).hexdigest()[:16]
@@ -8,6 +8,7 @@ def selected_code():
         var abstracts = [];
         var publicationDates = [];
         var clusters = [];
+        var similarPapers = [];
 
         cb_data.source.selected.indices.forEach(index => {
             titles.push(source.data['title'][index]);
@@ -15,72 +16,66 @@ def selected_code():
             abstracts.push(source.data['abstract'][index]);
             publicationDates.push(source.data['publication_date'][index]);
             clusters.push(source.data['cluster'][index]);
+            similarPapers.push(source.data['similar'][index]);
         });
 
         var title = "<p1><b>Title:</b> " + (titles[0] ? titles[0].toString() : "Not available.") + "<br>";
         var author = "<p1><b>Author:</b> " + (authors[0] ? authors[0].toString() : "Not available.") + "<br>";
         var abstract = "<p1><b>Abstract:</b> " + abstracts[0].toString() + "<br>";
         var publicationDate = "<p1><b>Publication Date:</b> " + publicationDates[0].toString() + "</p1><br>";
-        var cluster = "<p1><b>Cluster:</b> " + clusters[0].toString() + "</p1>";
+        var cluster = "<p1><b>Cluster:</b> " + clusters[0].toString() + "</p1><br>";
+        // each similar paper is stored as [title, x, y]
+        var similarTitles = (similarPapers[0] || []).map(similarPaper =>
+            "<li>" + (similarPaper[0] || "Title not available.") + "</li>"
+        );
+        var similar = "<p1><b>Similar Papers:</b></p1><ul>" + (similarTitles.length ? similarTitles.join("") : "<li>Not available.</li>") + "</ul>";
 
-        current_selection.text = title + author + abstract + publicationDate + cluster;
+        current_selection.text = title + author + abstract + publicationDate + cluster + similar;
         current_selection.change.emit();
+
+        // draw the links from the selected article to its similar papers
+        var xs = [];
+        var ys = [];
+        var selectedIndex = cb_data.source.selected.indices[0];
+        (similarPapers[0] || []).forEach(similarPaper => {
+            xs.push([source.data['x'][selectedIndex], similarPaper[1]]);
+            ys.push([source.data['y'][selectedIndex], similarPaper[2]]);
+        });
+        links.data = {'xs': xs, 'ys': ys};
+        links.change.emit();
     """
     return code
 
 # handle the keywords and search
-def input_callback(plot, source, out_text, topics): 
+def input_callback(out_text, topics): 
 
-    # slider call back for cluster selection
-    callback = CustomJS(args=dict(p=plot, source=source, out_text=out_text, topics=topics), code="""
+    # slider call back for cluster selection, the papers and the aggregated
+    # points are filtered by the tile loader of the page
+    callback = CustomJS(args=dict(out_text=out_text, topics=topics), code="""
 				var key = text.value;
 				key = key.toLowerCase();
 				var cluster = slider.value;
                 var clusters_count = slider.end;
-                var data = source.data; 
-                
-                
-                x = data['x'];
-                y = data['y'];
-                x_backup = data['x_backup'];
-                y_backup = data['y_backup'];
-                labels = data['cluster'];
-                abstract = data['abstract'];
-                title = data['title'];
-                author = data['author'];
+
                 if (cluster == clusters_count) {
                     out_text.text = 'Keywords: Slide to specific cluster to see the keywords.';
-                    for (i = 0; i < x.length; i++) {
-						if(abstract[i].toLowerCase().includes(key) || 
-                        (title[i] && title[i].toLowerCase().includes(key)) ||
-                        (author[i] && author[i].toLowerCase().includes(key))) {
-							x[i] = x_backup[i];
-							y[i] = y_backup[i];
-						} else {
-							x[i] = undefined;
-							y[i] = undefined;
-						}
-                    }
+                    cluster = null;
                 }
                 else {
                     out_text.text = 'Keywords: ' + topics[Number(cluster)];
-                    for (i = 0; i < x.length; i++) {
-                        if(labels[i] == cluster) {
-							if(abstract[i].toLowerCase().includes(key)
-                            || (title[i] && title[i].toLowerCase().includes(key))
-                            || (author[i] && author[i].toLowerCase().includes(key))) {
-								x[i] = x_backup[i];
-								y[i] = y_backup[i];
-							} else {
-								x[i] = undefined;
-								y[i] = undefined;
-							}
-                        } else {
-                            x[i] = undefined;
-                            y[i] = undefined;
-                        }
-                    }
                 }
-            source.change.emit();
+                if (window.paperTiles) {
+                    window.paperTiles.setFilter(key, cluster);
+                }
             """)
-    return callback
\ No newline at end of file
+    return callback
+
+
+# load the tiles of the visible part of the map
+def view_changed_code():
+    code = """
+        if (window.paperTiles) {
+            window.paperTiles.update();
+        }
+    """
+    return code
@@ -0,0 +1,178 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# columns of the papers that are stored in the paper tiles
+PAPER_COLUMNS = [
+    "x",
+    "y",
+    "abstract",
+    "title",
+    "author",
+    "publication_date",
+    "cluster",
+    "labels",
+    "similar",
+]
+# columns of the aggregated points that are stored in the other tiles
+AGGREGATE_COLUMNS = ["x", "y", "count", "cluster", "labels"]
+
+# The map is split into a quadtree of tiles: level z has 2^z x 2^z tiles.
+# The tiles of the deepest level contain the papers, the tiles of the other
+# levels contain the papers of each cluster aggregated in a grid of bins.
+TILE_BINS = 16
+# the deepest level is the first one with at most this many papers per tile
+# on average, the papers are only shown when zoomed in that far
+MAX_PAPERS_PER_TILE = 1000
+MAX_TILE_LEVEL = 6
+# a search only loads the paper tiles in view, and without confirmation at most
+# this many of them around the center of the view
+MAX_SEARCH_TILES = 16
+
+
+def get_fingerprint(*values) -> str:
+    """Hash the values, which have to be serializable to JSON."""
+
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def get_files_fingerprint(paths: list[str]) -> str:
+    """Hash the contents of the files."""
+
+    file_hash = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            file_hash.update(file.read())
+    return file_hash.hexdigest()
+
+
+def get_data_dir(plot_file_name: str) -> str:
+    """Get the directory of the data tiles and the manifest of the page."""
+
+    docs_dir, page_file_name = os.path.split(plot_file_name)
+    return os.path.join(docs_dir, "data", os.path.splitext(page_file_name)[0])
+
+
+def load_manifest(data_dir: str) -> dict:
+    manifest_path = os.path.join(data_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def save_manifest(data_dir: str, manifest: dict):
+    with open(os.path.join(data_dir, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+
+def get_tile_bounds(source_df: pd.DataFrame) -> list[float]:
+    """Get the square [x_start, y_start, x_end, y_end] around the papers,
+    so that the tiles are square too."""
+
+    x_start, x_end = float(source_df["x"].min()), float(source_df["x"].max())
+    y_start, y_end = float(source_df["y"].min()), float(source_df["y"].max())
+    # leave a margin, and avoid empty bounds for a single paper
+    half_size = max(x_end - x_start, y_end - y_start, 1.0) * 1.05 / 2
+    x_center, y_center = (x_start + x_end) / 2, (y_start + y_end) / 2
+    return [
+        x_center - half_size,
+        y_center - half_size,
+        x_center + half_size,
+        y_center + half_size,
+    ]
+
+
+def get_max_tile_level(papers_count: int) -> int:
+    """Get the level of the tiles that contain the papers."""
+
+    level = 0
+    while papers_count / 4**level > MAX_PAPERS_PER_TILE and level < MAX_TILE_LEVEL:
+        level += 1
+    return level
+
+
+def get_cells(
+    source_df: pd.DataFrame, bounds: list[float], cells_per_side: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get the column and row of the grid cell of each paper."""
+
+    cell_size = (bounds[2] - bounds[0]) / cells_per_side
+    cell_x = ((source_df["x"].values - bounds[0]) // cell_size).astype(int)
+    cell_y = ((source_df["y"].values - bounds[1]) // cell_size).astype(int)
+    return (
+        np.clip(cell_x, 0, cells_per_side - 1),
+        np.clip(cell_y, 0, cells_per_side - 1),
+    )
+
+
+def to_columns(df: pd.DataFrame, columns: list[str]) -> dict:
+    return {
+        column: json.loads(df[column].to_json(orient="values", double_precision=4))
+        for column in columns
+    }
+
+
+def get_tiles(source_df: pd.DataFrame, bounds: list[float], max_level: int) -> dict:
+    """Get the contents of the non-empty tiles of all levels by tile name."""
+
+    tiles = {}
+    for level in range(max_level + 1):
+        tiles_per_side = 2**level
+        tile_x, tile_y = get_cells(source_df, bounds, tiles_per_side)
+
+        if level == max_level:
+            tile_df = source_df
+        else:
+            # one point per cluster in each bin, at the mean position of its papers
+            bin_x, bin_y = get_cells(source_df, bounds, tiles_per_side * TILE_BINS)
+            tile_df = (
+                source_df.assign(bin_x=bin_x, bin_y=bin_y, tile_x=tile_x, tile_y=tile_y)
+                .groupby(
+                    ["tile_x", "tile_y", "bin_x", "bin_y", "cluster"], observed=True
+                )
+                .agg(x=("x", "mean"), y=("y", "mean"), count=("x", "size"))
+                .reset_index()
+            )
+            tile_df["labels"] = ["C-" + str(x) for x in tile_df["cluster"]]
+            tile_x, tile_y = tile_df["tile_x"].values, tile_df["tile_y"].values
+
+        columns = PAPER_COLUMNS if level == max_level else AGGREGATE_COLUMNS
+        for (x, y), df in tile_df.groupby([tile_x, tile_y]):
+            tiles[f"{level}_{x}_{y}"] = to_columns(df, columns)
+
+    return tiles
+
+
+def write_tiles(tiles: dict, data_dir: str, tile_hashes: dict) -> dict:
+    """Write the tiles to one JSON file each. Only the tiles whose content hash
+    differs from the provided one are written, and the files of tiles that
+    don't exist anymore are deleted. Returns the new content hashes."""
+
+    os.makedirs(data_dir, exist_ok=True)
+    new_tile_hashes = {}
+    written_count = 0
+    for tile_name, tile in tiles.items():
+        tile_json = json.dumps(tile, separators=(",", ":"))
+        tile_hash = hashlib.sha256(tile_json.encode()).hexdigest()
+        tile_path = os.path.join(data_dir, f"tile_{tile_name}.json")
+        new_tile_hashes[tile_name] = tile_hash
+        if tile_hashes.get(tile_name) == tile_hash and os.path.exists(tile_path):
+            continue
+        with open(tile_path, "w") as file:
+            file.write(tile_json)
+        written_count += 1
+
+    for tile_path in glob.glob(os.path.join(data_dir, "*.json")):
+        tile_name = os.path.basename(tile_path)[len("tile_") : -len(".json")]
+        if tile_path.endswith("manifest.json") or tile_name in new_tile_hashes:
+            continue
+        os.remove(tile_path)
+
+    print(f"{written_count} of {len(new_tile_hashes)} tiles written to {data_dir}")
+    return new_tile_hashes
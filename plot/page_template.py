@@ -0,0 +1,217 @@
+import json
+from jinja2 import Template
+
+# The papers are not embedded in the page, they are loaded from the tiles of
+# the page while the map is zoomed and panned. When zoomed out, the tiles of
+# the level matching the zoom contain the papers of each cluster aggregated
+# in bins, and only the deepest level contains the papers themselves, so the
+# number of points drawn and hit-tested stays small. A search needs the papers,
+# so the tiles of the deepest level in view are loaded then. If there are more
+# of them than the search limit, only the ones around the center of the view
+# are loaded, unless the user confirms to load them all.
+# The manifest is always fetched again, and the tiles are fetched with their
+# content hash, so that the cached tiles are only used while they are up to date.
+loader_script = """
+<script type="text/javascript">
+    (function () {
+        var config = TILE_CONFIG;
+        var manifest = null;
+        var models = null;
+        var tiles = {};
+        var loadedTiles = {};
+        var filter = {key: "", cluster: null};
+        // the answer of the user to search all tiles in view, for the search text
+        var searchAnswer = {key: null, searchAll: false};
+        var renderScheduled = false;
+
+        function getModels() {
+            var documents = window.Bokeh ? Bokeh.documents : [];
+            if (!documents.length || !documents[0].get_model_by_name("map")) {
+                return null;
+            }
+            return {
+                map: documents[0].get_model_by_name("map"),
+                papers: documents[0].get_model_by_name("papers"),
+                aggregates: documents[0].get_model_by_name("aggregates"),
+                links: documents[0].get_model_by_name("links"),
+            };
+        }
+
+        function loadTile(name) {
+            if (!(name in tiles)) {
+                tiles[name] = fetch(config.dataDir + "/tile_" + name + ".json?v=" + manifest.tiles[name])
+                    .then(response => response.json())
+                    .then(tile => {
+                        loadedTiles[name] = tile;
+                        scheduleRender();
+                    });
+            }
+        }
+
+        function getLevel() {
+            var size = config.bounds[2] - config.bounds[0];
+            var visibleSize = Math.max(
+                models.map.x_range.end - models.map.x_range.start,
+                models.map.y_range.end - models.map.y_range.start
+            );
+            var level = Math.floor(Math.log2(size / visibleSize));
+            return Math.max(0, Math.min(config.maxLevel, level));
+        }
+
+        function getVisibleTiles(level) {
+            var tilesPerSide = Math.pow(2, level);
+            var tileSize = (config.bounds[2] - config.bounds[0]) / tilesPerSide;
+            function getCell(value, start) {
+                var cell = Math.floor((value - start) / tileSize);
+                return Math.max(0, Math.min(tilesPerSide - 1, cell));
+            }
+            var xRange = models.map.x_range;
+            var yRange = models.map.y_range;
+            var names = [];
+            for (var x = getCell(xRange.start, config.bounds[0]); x <= getCell(xRange.end, config.bounds[0]); x++) {
+                for (var y = getCell(yRange.start, config.bounds[1]); y <= getCell(yRange.end, config.bounds[1]); y++) {
+                    var name = level + "_" + x + "_" + y;
+                    if (name in manifest.tiles) {
+                        names.push(name);
+                    }
+                }
+            }
+            return names;
+        }
+
+        function getSearchTiles() {
+            var names = getVisibleTiles(config.maxLevel);
+            if (names.length <= config.maxSearchTiles) {
+                return names;
+            }
+            if (searchAnswer.key !== filter.key) {
+                searchAnswer = {
+                    key: filter.key,
+                    searchAll: window.confirm(
+                        "The search covers " + names.length + " parts of the map. Search all of them? " +
+                        "Otherwise only the " + config.maxSearchTiles + " parts around the center of the view are searched."
+                    ),
+                };
+            }
+            if (searchAnswer.searchAll) {
+                return names;
+            }
+            var tileSize = (config.bounds[2] - config.bounds[0]) / Math.pow(2, config.maxLevel);
+            var centerX = ((models.map.x_range.start + models.map.x_range.end) / 2 - config.bounds[0]) / tileSize;
+            var centerY = ((models.map.y_range.start + models.map.y_range.end) / 2 - config.bounds[1]) / tileSize;
+            function getDistance(name) {
+                var cell = name.split("_").map(Number);
+                return Math.pow(cell[1] + 0.5 - centerX, 2) + Math.pow(cell[2] + 0.5 - centerY, 2);
+            }
+            return names
+                .sort((a, b) => getDistance(a) - getDistance(b))
+                .slice(0, config.maxSearchTiles);
+        }
+
+        function includes(values, index, key) {
+            return values[index] && values[index].toLowerCase().includes(key);
+        }
+
+        function matches(tile, index) {
+            if (filter.cluster !== null && tile.cluster[index] != filter.cluster) {
+                return false;
+            }
+            return !filter.key
+                || includes(tile.abstract, index, filter.key)
+                || includes(tile.title, index, filter.key)
+                || includes(tile.author, index, filter.key);
+        }
+
+        function getEmptyData(source) {
+            var data = {};
+            Object.keys(source.data).forEach(column => data[column] = []);
+            return data;
+        }
+
+        function render() {
+            renderScheduled = false;
+            if (!manifest || !models) {
+                return;
+            }
+
+            var isSearching = filter.key.length > 0;
+            var level = isSearching ? config.maxLevel : getLevel();
+            var names = isSearching ? getSearchTiles() : getVisibleTiles(level);
+            names.forEach(loadTile);
+            var loadedNames = names.filter(name => name in loadedTiles);
+            if (names.length > 0 && loadedNames.length == 0) {
+                // keep showing the previous tiles until the first new one is loaded
+                return;
+            }
+
+            var papersData = getEmptyData(models.papers);
+            var aggregatesData = getEmptyData(models.aggregates);
+            var data = level == config.maxLevel ? papersData : aggregatesData;
+            loadedNames.forEach(name => {
+                var tile = loadedTiles[name];
+                for (var index = 0; index < tile.x.length; index++) {
+                    if (matches(tile, index)) {
+                        Object.keys(tile).forEach(column => data[column].push(tile[column][index]));
+                    }
+                }
+            });
+            aggregatesData.size = aggregatesData.count.map(count => Math.min(30, 4 + 2 * Math.sqrt(count)));
+
+            // the selected paper may not be shown anymore, so its links are removed too
+            models.papers.selected.indices = [];
+            models.links.data = {xs: [], ys: []};
+            models.papers.data = papersData;
+            models.aggregates.data = aggregatesData;
+        }
+
+        function scheduleRender() {
+            if (!renderScheduled) {
+                renderScheduled = true;
+                setTimeout(render, 50);
+            }
+        }
+
+        window.paperTiles = {
+            update: scheduleRender,
+            setFilter: function (key, cluster) {
+                filter = {key: key, cluster: cluster};
+                scheduleRender();
+            },
+        };
+
+        fetch(config.dataDir + "/manifest.json", {cache: "no-cache"})
+            .then(response => response.json())
+            .then(loadedManifest => {
+                manifest = loadedManifest;
+                scheduleRender();
+            });
+
+        // the plot script may still be embedding the document
+        var waitForModels = setInterval(function () {
+            models = getModels();
+            if (models) {
+                clearInterval(waitForModels);
+                scheduleRender();
+            }
+        }, 50);
+    })();
+</script>
+"""
+
+
+def get_page_template(tile_config: dict) -> Template:
+    """Get the template of the page, which loads the tiles described by the
+    tile config: the data directory relative to the page, the bounds of the
+    tiles, and the level of the tiles that contain the papers."""
+
+    return Template(
+        """
+{% extends base %}
+{% block inner_body %}
+    {{ super() }}
+"""
+        + loader_script.replace("TILE_CONFIG", json.dumps(tile_config))
+        + """
+{% endblock %}
+"""
+    )
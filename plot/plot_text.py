@@ -22,6 +22,10 @@ time_range_last_year_button = Div(
     text="""<a href="clusters_last_year.html" target="_blank"><button>Last Year</button></a>"""
 )
 
+time_range_all_time_button = Div(
+    text="""<a href="clusters_all_time.html" target="_blank"><button>All Time</button></a>"""
+)
+
 # project description
 description = Div(
     text="""Clustering of literature on supervised learning by classification from ACM Digital Library. 
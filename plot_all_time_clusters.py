@@ -0,0 +1,4 @@
+from plot_clusters import ClusterTimeRange, plot_clusters
+
+
+plot_clusters(ClusterTimeRange.ALL_TIME)
@@ -4,6 +4,7 @@ from bokeh.models import (
     ColumnDataSource,
     HoverTool,
     CustomJS,
+    Range1d,
     Slider,
     TapTool,
     TextInput,
@@ -14,10 +15,30 @@ from bokeh.plotting import figure
 from bokeh.models import TextInput, Div, Paragraph
 from bokeh.layouts import row, layout
 from bokeh.plotting import save
+import json
+import os
 import re
+import pandas as pd
+from feature_group_reader import read_compact
 from model.cluster_data import ClusterData
 from model.cluster_time_range import ClusterTimeRange
-from plot.callbacks import input_callback, selected_code
+from paper_key import get_paper_key
+from plot.callbacks import input_callback, selected_code, view_changed_code
+from plot.data_shards import (
+    AGGREGATE_COLUMNS,
+    MAX_SEARCH_TILES,
+    PAPER_COLUMNS,
+    get_data_dir,
+    get_files_fingerprint,
+    get_fingerprint,
+    get_max_tile_level,
+    get_tile_bounds,
+    get_tiles,
+    load_manifest,
+    save_manifest,
+    write_tiles,
+)
+from plot.page_template import get_page_template
 from plot.plot_text import (
     header_with_time_range,
     description,
@@ -25,12 +46,38 @@ from plot.plot_text import (
     time_range_last_month_button,
     time_range_last_half_year_button,
     time_range_last_year_button,
+    time_range_all_time_button,
     description_search,
     description_slider,
 )
 
+# a change of these files changes the page, so it is rendered again
+PLOT_CODE_FILES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    for file_name in [
+        "plot_clusters.py",
+        "plot/callbacks.py",
+        "plot/data_shards.py",
+        "plot/page_template.py",
+        "plot/plot_text.py",
+    ]
+]
+
+# columns of the clustered papers that are shown on the plot
+PLOT_COLUMNS = [
+    "citation",
+    "abstract",
+    "publication_date",
+    "cluster",
+    "x_coord",
+    "y_coord",
+    "similar_papers",
+]
+
+
+def get_feature_groups(time_range: ClusterTimeRange) -> tuple:
+    """Get the feature groups of the clustered papers and of the cluster keywords."""
 
-def get_clusters(time_range: ClusterTimeRange) -> ClusterData:
     # Login to Hopsworks
     project = hopsworks.login()
     fs = project.get_feature_store()
@@ -42,8 +89,9 @@ def get_clusters(time_range: ClusterTimeRange) -> ClusterData:
         papers_fg_name = "acm_papers_clustered_last_half_year"
     elif time_range == ClusterTimeRange.LAST_YEAR:
         papers_fg_name = "acm_papers_clustered_last_year"
-    papers_fg = fs.get_feature_group(papers_fg_name, 1)
-    papers_df = papers_fg.read(read_options={"use_hive": True})
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        papers_fg_name = "acm_papers_clustered_all_time"
+    papers_fg = fs.get_feature_group(papers_fg_name, 2)
 
     # Get the topics for the provided time range
     if time_range == ClusterTimeRange.LAST_MONTH:
@@ -52,8 +100,42 @@ def get_clusters(time_range: ClusterTimeRange) -> ClusterData:
         keywords_fg_name = "acm_papers_cluster_keywords_last_half_year"
     elif time_range == ClusterTimeRange.LAST_YEAR:
         keywords_fg_name = "acm_papers_cluster_keywords_last_year"
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        keywords_fg_name = "acm_papers_cluster_keywords_all_time"
     keywords_fg = fs.get_feature_group(keywords_fg_name, 1)
-    keywords_df = keywords_fg.read(read_options={"use_hive": True})
+
+    return papers_fg, keywords_fg
+
+
+def get_inputs_fingerprint(feature_groups: list) -> str | None:
+    """Hash the last commits of the feature groups, without reading their data.
+    Returns None if the commits are not available."""
+
+    try:
+        commit_ids = [
+            max(feature_group.commit_details(limit=1), default=None)
+            for feature_group in feature_groups
+        ]
+    except Exception as error:
+        print(f"Could not get the commits of the feature groups: {error!r}")
+        return None
+    if None in commit_ids:
+        return None
+    return get_fingerprint(commit_ids)
+
+
+def get_clusters(time_range: ClusterTimeRange) -> ClusterData:
+    return read_clusters(*get_feature_groups(time_range))
+
+
+def read_clusters(papers_fg, keywords_fg) -> ClusterData:
+    # the cleaned abstracts are only needed for the training
+    papers_columns = [
+        feature.name for feature in papers_fg.features if feature.name in PLOT_COLUMNS
+    ]
+    papers_df = read_compact(papers_fg.select(papers_columns))
+
+    keywords_df = read_compact(keywords_fg.select(["cluster", "keywords"]))
     # sort by cluster
     keywords_df.sort_values(by=["cluster"], inplace=True)
     topics = keywords_df["keywords"].values.tolist()
@@ -69,11 +151,70 @@ def extract_bibtex_field(bibtex_string, field):
     return value
 
 
+def get_similar_paper_details(papers_df) -> list[list[list]]:
+    """Get the title and the coordinates of the similar papers of each paper,
+    so that they can be shown without loading the tiles they are in."""
+
+    if "similar_papers" not in papers_df:
+        return [[] for _ in range(len(papers_df))]
+
+    # the similar papers are stored by their keys, not their citations
+    details = dict(
+        zip(
+            papers_df["citation"].map(get_paper_key),
+            zip(papers_df["title"], papers_df["x_coord"], papers_df["y_coord"]),
+        )
+    )
+    similar_paper_details = []
+    for similar_papers in papers_df["similar_papers"]:
+        similar_keys = (
+            json.loads(similar_papers)
+            if pd.notna(similar_papers) and similar_papers
+            else []
+        )
+        similar_paper_details.append(
+            [list(details[key]) for key in similar_keys if key in details]
+        )
+    return similar_paper_details
+
+
 def plot_clusters(time_range: ClusterTimeRange):
-    """Plot the clusters for the provided time range to a html file."""
+    """Plot the clusters for the provided time range to a html file.
+    The papers are written to a quadtree of tiles next to the page, which the
+    page loads depending on the zoom. Nothing is written if the feature groups
+    and the plotting code haven't changed since the last run, and only the
+    changed tiles are written otherwise.
+    """
+
+    if time_range == ClusterTimeRange.LAST_MONTH:
+        plot_file_name = "docs/clusters_last_month.html"
+        time_range_str = "Last Month"
+    elif time_range == ClusterTimeRange.LAST_HALF_YEAR:
+        plot_file_name = "docs/clusters_last_half_year.html"
+        time_range_str = "Last Half Year"
+    elif time_range == ClusterTimeRange.LAST_YEAR:
+        plot_file_name = "docs/clusters_last_year.html"
+        time_range_str = "Last Year"
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        plot_file_name = "docs/clusters_all_time.html"
+        time_range_str = "All Time"
+
+    data_dir = get_data_dir(plot_file_name)
+    manifest = load_manifest(data_dir)
+    code_fingerprint = get_files_fingerprint(PLOT_CODE_FILES)
 
     # -------- Data --------
-    cluster_data = get_clusters(time_range)
+    papers_fg, keywords_fg = get_feature_groups(time_range)
+    inputs_fingerprint = get_inputs_fingerprint([papers_fg, keywords_fg])
+    if inputs_fingerprint is not None:
+        inputs_fingerprint = get_fingerprint(inputs_fingerprint, code_fingerprint)
+        if manifest.get("inputs") == inputs_fingerprint and os.path.exists(
+            plot_file_name
+        ):
+            print(f"{plot_file_name} is up to date, skipping")
+            return
+
+    cluster_data = read_clusters(papers_fg, keywords_fg)
     papers_df = cluster_data.papers_df
     topics = cluster_data.topics
 
@@ -85,26 +226,77 @@ def plot_clusters(time_range: ClusterTimeRange):
         lambda x: extract_bibtex_field(x, "author")
     )
 
-    # data sources
-    source = ColumnDataSource(
-        data=dict(
+    source_df = pd.DataFrame(
+        dict(
             x=papers_df["x_coord"],
             y=papers_df["y_coord"],
-            x_backup=papers_df["x_coord"],
-            y_backup=papers_df["y_coord"],
             abstract=papers_df["abstract"],
             title=papers_df["title"],
             author=papers_df["author"],
             publication_date=papers_df["publication_date"],
             cluster=papers_df["cluster"],
             labels=["C-" + str(x) for x in papers_df["cluster"]],
+            similar=get_similar_paper_details(papers_df),
         )
     )
+    tile_bounds = get_tile_bounds(source_df)
+    max_tile_level = get_max_tile_level(len(source_df))
+    tiles = get_tiles(source_df, tile_bounds, max_tile_level)
+    tile_hashes = write_tiles(tiles, data_dir, manifest.get("tiles", {}))
 
     max_cluster_value = papers_df["cluster"].max()
     min_cluster_value = papers_df["cluster"].min()
     clusters_count = max_cluster_value - min_cluster_value + 1
 
+    # the page only depends on the keywords, the clusters and the tiles' layout,
+    # not on the papers
+    tile_config = dict(
+        dataDir=os.path.relpath(data_dir, os.path.dirname(plot_file_name)),
+        bounds=tile_bounds,
+        maxLevel=max_tile_level,
+        maxSearchTiles=MAX_SEARCH_TILES,
+    )
+    page_fingerprint = get_fingerprint(
+        code_fingerprint,
+        topics,
+        int(min_cluster_value),
+        int(max_cluster_value),
+        tile_config,
+    )
+    new_manifest = {
+        "inputs": inputs_fingerprint,
+        "page": page_fingerprint,
+        "tiles": tile_hashes,
+    }
+    if manifest.get("page") == page_fingerprint and os.path.exists(plot_file_name):
+        print(f"{plot_file_name} is up to date, only the tiles were updated")
+        save_manifest(data_dir, new_manifest)
+        return
+
+    # data sources, the papers and the aggregated points are loaded from the
+    # tiles of the visible part of the map by the page
+    source = ColumnDataSource(
+        data={column: [] for column in PAPER_COLUMNS}, name="papers"
+    )
+    aggregates_source = ColumnDataSource(
+        data={column: [] for column in AGGREGATE_COLUMNS + ["size"]},
+        name="aggregates",
+    )
+    # one point without coordinates per cluster, so that the legend shows
+    # all clusters whichever tiles are loaded
+    cluster_values = list(range(int(min_cluster_value), int(max_cluster_value) + 1))
+    legend_source = ColumnDataSource(
+        data=dict(
+            x=[float("nan")] * len(cluster_values),
+            y=[float("nan")] * len(cluster_values),
+            cluster=cluster_values,
+            labels=["C-" + str(x) for x in cluster_values],
+        )
+    )
+
+    # links from the selected paper to its similar papers
+    links_source = ColumnDataSource(data=dict(xs=[], ys=[]), name="links")
+
     # hover over information
     hover = HoverTool(
         tooltips=[
@@ -116,11 +308,16 @@ def plot_clusters(time_range: ClusterTimeRange):
         ],
         point_policy="follow_mouse",
     )
+    aggregates_hover = HoverTool(
+        tooltips=[("Cluster", "@cluster"), ("Papers", "@count")],
+        point_policy="follow_mouse",
+    )
 
     # map colors
     mapper = linear_cmap(
         field_name="cluster",
-        palette=Category20[clusters_count],
+        # the smallest palette has 3 colors
+        palette=Category20[max(clusters_count, 3)],
         low=min_cluster_value,
         high=max_cluster_value,
     )
@@ -129,13 +326,16 @@ def plot_clusters(time_range: ClusterTimeRange):
     plot = figure(
         width=500,
         height=500,
-        tools=[hover, "pan", "wheel_zoom", "box_zoom", "reset", "save", "tap"],
+        tools=["pan", "wheel_zoom", "box_zoom", "reset", "save", "tap"],
         title="Clustering of the ACM papers on Supervised Learning by Classification",
         toolbar_location="above",
+        x_range=Range1d(tile_bounds[0], tile_bounds[2]),
+        y_range=Range1d(tile_bounds[1], tile_bounds[3]),
+        name="map",
     )
 
     # plot settings
-    plot.scatter(
+    papers_renderer = plot.scatter(
         "x",
         "y",
         size=5,
@@ -143,9 +343,29 @@ def plot_clusters(time_range: ClusterTimeRange):
         fill_color=mapper,
         line_alpha=0.3,
         line_color="black",
-        legend="labels",
     )
+    aggregates_renderer = plot.scatter(
+        "x",
+        "y",
+        size="size",
+        source=aggregates_source,
+        fill_color=mapper,
+        fill_alpha=0.6,
+        line_alpha=0.3,
+        line_color="black",
+    )
+    plot.scatter("x", "y", source=legend_source, fill_color=mapper, legend="labels")
     plot.legend.background_fill_alpha = 0.6
+    hover.renderers = [papers_renderer]
+    aggregates_hover.renderers = [aggregates_renderer]
+    plot.add_tools(hover, aggregates_hover)
+
+    # load the tiles when the map is zoomed or panned
+    view_changed_callback = CustomJS(code=view_changed_code())
+    for plot_range in (plot.x_range, plot.y_range):
+        plot_range.js_on_change("start", view_changed_callback)
+        plot_range.js_on_change("end", view_changed_callback)
+    plot.multi_line("xs", "ys", source=links_source, line_color="black", line_alpha=0.5)
 
     # -------- Callbacks --------
 
@@ -153,17 +373,19 @@ def plot_clusters(time_range: ClusterTimeRange):
     text_banner = Paragraph(
         text="Keywords: Slide to specific cluster to see the keywords.", height=25
     )
-    input_callback_1 = input_callback(plot, source, text_banner, topics)
+    input_callback_1 = input_callback(text_banner, topics)
 
     # currently selected article
     div_curr = Div(
         text="""Click on a plot to see the info about the article.""", width=150
     )
     callback_selected = CustomJS(
-        args=dict(source=source, current_selection=div_curr), code=selected_code()
+        args=dict(source=source, current_selection=div_curr, links=links_source),
+        code=selected_code(),
     )
     tap_tool = plot.select(type=TapTool)
     tap_tool.callback = callback_selected
+    tap_tool.renderers = [papers_renderer]
 
     # WIDGETS
     slider = Slider(
@@ -180,16 +402,6 @@ def plot_clusters(time_range: ClusterTimeRange):
     input_callback_1.args["text"] = keyword
     input_callback_1.args["slider"] = slider
 
-    if time_range == ClusterTimeRange.LAST_MONTH:
-        plot_file_name = "docs/clusters_last_month.html"
-        time_range_str = "Last Month"
-    elif time_range == ClusterTimeRange.LAST_HALF_YEAR:
-        plot_file_name = "docs/clusters_last_half_year.html"
-        time_range_str = "Last Half Year"
-    elif time_range == ClusterTimeRange.LAST_YEAR:
-        plot_file_name = "docs/clusters_last_year.html"
-        time_range_str = "Last Year"
-
     header = header_with_time_range(time_range_str)
 
     # -------- Style --------
@@ -264,6 +476,9 @@ def plot_clusters(time_range: ClusterTimeRange):
     elif time_range == ClusterTimeRange.LAST_YEAR:
         plot_file_name = "docs/clusters_last_year.html"
         time_range_str = "Last Year"
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        plot_file_name = "docs/clusters_all_time.html"
+        time_range_str = "All Time"
 
     l = layout(
         [
@@ -274,6 +489,7 @@ def plot_clusters(time_range: ClusterTimeRange):
                 time_range_last_month_button,
                 time_range_last_half_year_button,
                 time_range_last_year_button,
+                time_range_all_time_button,
             ],
             [description_slider, description_search],
             [slider, keyword],
@@ -287,4 +503,6 @@ def plot_clusters(time_range: ClusterTimeRange):
         l,
         title="Clustering papers on Supervised Learning by Classification",
         filename=plot_file_name,
+        template=get_page_template(tile_config),
     )
+    save_manifest(data_dir, new_manifest)
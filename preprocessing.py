@@ -0,0 +1,45 @@
+from functools import cache
+import string
+import spacy
+from spacy.lang.en import STOP_WORDS
+from custom_stop_words import custom_stop_words
+
+# "Abstract\n" at the beginning of the abstract is a scraping error
+scraping_error = "Abstract\n"
+
+punctuations = string.punctuation
+stop_words = set(STOP_WORDS) | set(custom_stop_words)
+
+
+@cache
+def get_parser() -> spacy.language.Language:
+    """Load the spaCy pipeline once, it is reused for every abstract."""
+
+    return spacy.load("en_core_web_trf", disable=["tagger", "ner"])
+
+
+def tokens_to_text(tokens) -> str:
+    """Lemmatize the tokens and remove punctuation and stop words."""
+
+    words = [
+        token.lemma_.lower().strip() if token.lemma_ != "-PRON-" else token.lower_
+        for token in tokens
+    ]
+    words = [
+        word for word in words if word not in stop_words and word not in punctuations
+    ]
+    return " ".join(words)
+
+
+def spacy_tokenizer(sentence: str) -> str:
+    return tokens_to_text(get_parser()(sentence))
+
+
+def clean_abstracts(abstracts: list[str], batch_size: int = 32) -> list[str]:
+    """Clean a batch of abstracts, with the same steps as the training data."""
+
+    abstracts = [abstract.removeprefix(scraping_error) for abstract in abstracts]
+    return [
+        tokens_to_text(tokens)
+        for tokens in get_parser().pipe(abstracts, batch_size=batch_size)
+    ]
@@ -0,0 +1,157 @@
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class ThrottledError(Exception):
+    """The site responded with a rate limiting page."""
+
+
+class ServerError(Exception):
+    """The site responded with a server error page."""
+
+
+# Errors that mean the site is overloaded. Only these are retried and decrease
+# the concurrency limit. Other errors, like a page without the expected
+# element, fail the same way on every attempt.
+RETRYABLE_ERRORS = (ThrottledError, ServerError, TimeoutError)
+
+
+class TokenBucket:
+    """Allow on average `rate` requests per second, with bursts of `capacity` requests."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last_refill) * self.rate
+            )
+            self.last_refill = now
+            # The token is reserved now, the caller waits until it's refilled
+            self.tokens -= 1
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+        time.sleep(wait_time)
+
+
+class RequestScheduler:
+    """Run requests with a rate limit, retries with exponential backoff and
+    jitter, and an adaptive concurrency limit: the limit grows additively while
+    requests are fast and succeed, and is halved when they are slow or the site
+    is overloaded. Requests are plain callables that raise one of the
+    RETRYABLE_ERRORS when the site is overloaded, so the scheduler can be
+    exercised against any server, e.g. a local one that injects delays and errors."""
+
+    def __init__(
+        self,
+        rate: float = 1,
+        burst: float = 2,
+        min_concurrency: int = 1,
+        max_concurrency: int = 4,
+        timeout: float = 30,
+        target_latency: float = 10,
+        max_retries: int = 4,
+        base_backoff: float = 2,
+        max_backoff: float = 60,
+    ):
+        self.token_bucket = TokenBucket(rate, burst)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.concurrency_limit = float(min_concurrency)
+        self.active_requests = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        self.successes = 0
+        self.failures = 0
+        self.retryable_failures = 0
+        self.total_latency = 0.0
+
+    def call(self, request: Callable[[], T]) -> T:
+        """Run the request, retrying it if it fails with a retryable error.
+        Other errors are raised right away."""
+
+        for attempt in range(self.max_retries + 1):
+            self._acquire_slot()
+            self.token_bucket.acquire()
+            start_time = time.monotonic()
+            try:
+                result = request()
+            except RETRYABLE_ERRORS as error:
+                self._release_slot(
+                    time.monotonic() - start_time, failed=True, overloaded=True
+                )
+                if attempt == self.max_retries:
+                    raise
+                backoff = min(self.max_backoff, self.base_backoff * 2**attempt)
+                # Full jitter, so that concurrent retries don't line up
+                backoff = random.uniform(0, backoff)
+                print(
+                    f"Request failed ({type(error).__name__}), retrying in {backoff:.1f}s"
+                )
+                time.sleep(backoff)
+            except BaseException:
+                self._release_slot(time.monotonic() - start_time, failed=True)
+                raise
+            else:
+                self._release_slot(time.monotonic() - start_time, failed=False)
+                return result
+
+    def summary(self) -> str:
+        requests = self.successes + self.failures
+        mean_latency = self.total_latency / max(requests, 1)
+        return (
+            f"{requests} requests, {self.failures} failed "
+            f"({self.retryable_failures} retryable), "
+            f"mean latency {mean_latency:.2f}s, "
+            f"concurrency limit {self.concurrency_limit:.1f}"
+        )
+
+    def _acquire_slot(self):
+        with self.condition:
+            while self.active_requests >= int(self.concurrency_limit):
+                self.condition.wait()
+            self.active_requests += 1
+
+    def _release_slot(self, latency: float, failed: bool, overloaded: bool = False):
+        with self.condition:
+            self.active_requests -= 1
+            self.total_latency += latency
+            if failed:
+                self.failures += 1
+            else:
+                self.successes += 1
+            if overloaded:
+                self.retryable_failures += 1
+
+            now = time.monotonic()
+            # Other failures say nothing about the load of the site,
+            # so they leave the limit as it is
+            if overloaded or (not failed and latency > self.target_latency):
+                # Decrease at most once per latency target, so that the requests
+                # that were already running don't decrease it again
+                if now - self.last_decrease > self.target_latency:
+                    self.concurrency_limit = max(
+                        self.min_concurrency, self.concurrency_limit / 2
+                    )
+                    self.last_decrease = now
+            elif not failed:
+                self.concurrency_limit = min(
+                    self.max_concurrency,
+                    self.concurrency_limit + 1 / self.concurrency_limit,
+                )
+            self.condition.notify_all()
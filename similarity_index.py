@@ -0,0 +1,103 @@
+import json
+import joblib
+import numpy as np
+from pynndescent import NNDescent
+from paper_key import get_paper_key
+
+random_seed = 42
+
+# number of similar papers stored for each paper
+SIMILAR_PAPERS_COUNT = 5
+
+
+def build_similarity_index(
+    X_reduced: np.ndarray, n_neighbors: int = SIMILAR_PAPERS_COUNT + 1
+) -> NNDescent:
+    """Build an approximate nearest-neighbour index over the reduced vectors.
+    NN-descent with random projection tree initialisation avoids computing
+    all pairwise distances, so it scales to the full corpus. n_neighbors is
+    the number of neighbours of each paper in the neighbour graph, including
+    the paper itself."""
+
+    n_neighbors = min(max(n_neighbors, SIMILAR_PAPERS_COUNT + 1), len(X_reduced) - 1)
+    index = NNDescent(
+        X_reduced,
+        metric="euclidean",
+        n_neighbors=n_neighbors,
+        random_state=random_seed,
+    )
+    # Build the search graph now, so that the first query is fast too
+    index.prepare()
+
+    return index
+
+
+def query_similarity_index(
+    index: NNDescent, X: np.ndarray, k: int = SIMILAR_PAPERS_COUNT
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get the indices and distances of the k nearest neighbours for a batch of vectors."""
+
+    neighbor_indices, neighbor_distances = index.query(X, k=k)
+    return neighbor_indices, neighbor_distances
+
+
+def get_similar_papers(index: NNDescent, citations: list[str]) -> list[str]:
+    """Get the keys of the most similar papers for each indexed paper,
+    encoded as JSON lists. The keys are much shorter than the citations."""
+
+    # The neighbour graph was computed while building the index,
+    # so no extra queries are needed for the indexed papers
+    neighbor_indices, _ = index.neighbor_graph
+    paper_keys = [get_paper_key(citation) for citation in citations]
+
+    similar_papers = []
+    for paper_index, neighbors in enumerate(neighbor_indices):
+        similar_keys = [
+            paper_keys[neighbor]
+            for neighbor in neighbors
+            if neighbor >= 0 and neighbor != paper_index
+        ]
+        similar_papers.append(json.dumps(similar_keys[:SIMILAR_PAPERS_COUNT]))
+
+    return similar_papers
+
+
+def get_similar_papers_for_vectors(
+    index: NNDescent, citations: list[str], X: np.ndarray
+) -> list[str]:
+    """Get the keys of the most similar indexed papers for each vector,
+    encoded as JSON lists."""
+
+    neighbor_indices, _ = query_similarity_index(index, X)
+    paper_keys = [get_paper_key(citation) for citation in citations]
+    return [
+        json.dumps([paper_keys[neighbor] for neighbor in neighbors])
+        for neighbors in neighbor_indices
+    ]
+
+
+def save_similarity_index(
+    index: NNDescent,
+    X_reduced: np.ndarray,
+    citations: list[str],
+    artifacts_dir: str,
+):
+    """Save the reduced vectors and the index to the artifacts directory."""
+
+    np.save(f"{artifacts_dir}/vectors.npy", np.asarray(X_reduced, dtype=np.float32))
+    joblib.dump(index, f"{artifacts_dir}/similarity_index.joblib")
+    with open(f"{artifacts_dir}/citations.json", "w") as file:
+        json.dump(list(citations), file)
+
+
+def load_similarity_index(
+    artifacts_dir: str,
+) -> tuple[NNDescent, np.ndarray, list[str]]:
+    """Load the index, the reduced vectors and the citations from the artifacts directory."""
+
+    index = joblib.load(f"{artifacts_dir}/similarity_index.joblib")
+    X_reduced = np.load(f"{artifacts_dir}/vectors.npy")
+    with open(f"{artifacts_dir}/citations.json") as file:
+        citations = json.load(file)
+
+    return index, X_reduced, citations
@@ -0,0 +1,250 @@
+from collections import Counter
+from typing import Iterable, Iterator
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import normalize
+from class_tfidf import get_class_tfidf_keywords, get_keyword_vectorizer
+
+random_seed = 42
+
+# Number of papers vectorized, reduced and clustered at once. Together with the
+# number of hashed features, this bounds the peak memory of the streaming mode:
+# a dense batch takes 1000 * 2**14 * 8 bytes = 131 MB.
+STREAMING_BATCH_SIZE = 1000
+HASHED_FEATURES_COUNT = 2**14
+# PCA can't pick the components by explained variance incrementally
+STREAMING_COMPONENTS_COUNT = 100
+# t-SNE is fitted on a sample, the other papers are placed next to their neighbours
+EMBEDDING_SAMPLE_SIZE = 10000
+EMBEDDING_NEIGHBORS_COUNT = 10
+CLUSTERING_EPOCHS = 3
+
+
+def get_hashing_vectorizer() -> HashingVectorizer:
+    """Get the stateless vectorizer used for the term counts."""
+
+    return HashingVectorizer(
+        n_features=HASHED_FEATURES_COUNT, alternate_sign=False, norm=None
+    )
+
+
+def get_tfidf_vectorizer(idf: np.ndarray) -> Pipeline:
+    """Get a vectorizer of new abstracts, with the same feature hashing and
+    TF-IDF weighting as the batches, and the IDF accumulated over the papers."""
+
+    tfidf_transformer = TfidfTransformer()
+    tfidf_transformer.idf_ = idf
+    return make_pipeline(get_hashing_vectorizer(), tfidf_transformer)
+
+
+def hash_abstracts_to_disk(
+    clean_chunks: Iterable[pd.DataFrame], work_dir: str
+) -> tuple[int, int, np.ndarray]:
+    """Hash the cleaned abstracts of each chunk and write them to the work
+    directory in batches of equal size, together with the papers. Returns the
+    number of batches, the number of papers and the IDF accumulated over all papers."""
+
+    vectorizer = get_hashing_vectorizer()
+    document_frequency = np.zeros(HASHED_FEATURES_COUNT, dtype=np.int64)
+    documents_count = 0
+    batch_count = 0
+
+    pending_papers = []
+    pending_counts = []
+    pending_rows = 0
+
+    def write_batch(papers_df: pd.DataFrame, term_counts: sparse.csr_matrix):
+        papers_df.to_parquet(f"{work_dir}/papers_{batch_count}.parquet", index=False)
+        sparse.save_npz(f"{work_dir}/counts_{batch_count}.npz", term_counts)
+
+    for chunk_df in clean_chunks:
+        if len(chunk_df) == 0:
+            continue
+        chunk_df = chunk_df.reset_index(drop=True)
+        term_counts = vectorizer.transform(chunk_df["abstract_clean"]).tocsr()
+        document_frequency += np.bincount(
+            term_counts.indices, minlength=HASHED_FEATURES_COUNT
+        )
+        documents_count += term_counts.shape[0]
+
+        pending_papers.append(chunk_df)
+        pending_counts.append(term_counts)
+        pending_rows += len(chunk_df)
+
+        # Write out full batches, keep the rest for the next chunk
+        while pending_rows >= STREAMING_BATCH_SIZE:
+            papers_df = pd.concat(pending_papers, ignore_index=True)
+            counts = sparse.vstack(pending_counts).tocsr()
+            write_batch(
+                papers_df.iloc[:STREAMING_BATCH_SIZE],
+                counts[:STREAMING_BATCH_SIZE],
+            )
+            batch_count += 1
+            pending_papers = [papers_df.iloc[STREAMING_BATCH_SIZE:]]
+            pending_counts = [counts[STREAMING_BATCH_SIZE:]]
+            pending_rows -= STREAMING_BATCH_SIZE
+
+    if pending_rows > 0:
+        write_batch(
+            pd.concat(pending_papers, ignore_index=True),
+            sparse.vstack(pending_counts).tocsr(),
+        )
+        batch_count += 1
+
+    # Same smoothed IDF as TfidfVectorizer
+    idf = np.log((1 + documents_count) / (1 + document_frequency)) + 1
+
+    return batch_count, documents_count, idf
+
+
+def iter_tfidf_batches(
+    work_dir: str, batch_count: int, idf: np.ndarray
+) -> Iterator[sparse.csr_matrix]:
+    """Iterate over the TF-IDF vectors of the batches in the work directory."""
+
+    for batch in range(batch_count):
+        term_counts = sparse.load_npz(f"{work_dir}/counts_{batch}.npz")
+        yield normalize(term_counts.multiply(idf).tocsr())
+
+
+def iter_paper_batches(
+    work_dir: str, batch_count: int, columns: list[str] | None = None
+) -> Iterator[pd.DataFrame]:
+    """Iterate over the papers of the batches in the work directory,
+    with all columns unless the columns are provided."""
+
+    for batch in range(batch_count):
+        yield pd.read_parquet(f"{work_dir}/papers_{batch}.parquet", columns=columns)
+
+
+def reduce_incrementally(
+    work_dir: str, batch_count: int, idf: np.ndarray
+) -> tuple[IncrementalPCA, np.ndarray]:
+    """Reduce the TF-IDF vectors with incremental PCA. There have to be at least
+    STREAMING_COMPONENTS_COUNT papers to fit it.
+    The reduced vectors are written to a memory-mapped file in the work directory."""
+
+    pca = IncrementalPCA(n_components=STREAMING_COMPONENTS_COUNT)
+    documents_count = 0
+    for X_batch in iter_tfidf_batches(work_dir, batch_count, idf):
+        documents_count += X_batch.shape[0]
+        # Only the last batch can be smaller, it is skipped if it's too small to fit
+        if X_batch.shape[0] >= STREAMING_COMPONENTS_COUNT:
+            pca.partial_fit(X_batch.toarray())
+
+    X_reduced = np.lib.format.open_memmap(
+        f"{work_dir}/reduced.npy",
+        mode="w+",
+        dtype=np.float32,
+        shape=(documents_count, STREAMING_COMPONENTS_COUNT),
+    )
+    offset = 0
+    for X_batch in iter_tfidf_batches(work_dir, batch_count, idf):
+        X_reduced[offset : offset + X_batch.shape[0]] = pca.transform(X_batch.toarray())
+        offset += X_batch.shape[0]
+    X_reduced.flush()
+
+    return pca, X_reduced
+
+
+def iter_reduced_batches(X_reduced: np.ndarray) -> Iterator[np.ndarray]:
+    """Iterate over the reduced vectors in batches. The batches are converted to
+    float64, like the vectors of new papers, so that k-means fitted on them
+    can assign the new papers too."""
+
+    for start in range(0, len(X_reduced), STREAMING_BATCH_SIZE):
+        yield np.asarray(
+            X_reduced[start : start + STREAMING_BATCH_SIZE], dtype=np.float64
+        )
+
+
+def cluster_incrementally(
+    X_reduced: np.ndarray, k: int
+) -> tuple[MiniBatchKMeans, np.ndarray]:
+    """Cluster the reduced vectors with mini-batch k-means."""
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=k, batch_size=STREAMING_BATCH_SIZE, random_state=random_seed
+    )
+    for _ in range(CLUSTERING_EPOCHS):
+        for X_batch in iter_reduced_batches(X_reduced):
+            # partial_fit needs at least k samples
+            if len(X_batch) >= k:
+                kmeans.partial_fit(X_batch)
+
+    clusters = np.concatenate(
+        [kmeans.predict(X_batch) for X_batch in iter_reduced_batches(X_reduced)]
+    )
+    return kmeans, clusters
+
+
+def embed_with_sample(X_reduced: np.ndarray, perplexity: int) -> np.ndarray:
+    """Get the 2D embeddings by fitting t-SNE on a sample of the papers.
+    The other papers are placed at the mean position of their nearest sampled neighbours.
+    """
+
+    rng = np.random.default_rng(random_seed)
+    sample_size = min(EMBEDDING_SAMPLE_SIZE, len(X_reduced))
+    sample = np.sort(rng.choice(len(X_reduced), size=sample_size, replace=False))
+    X_sample = np.asarray(X_reduced[sample])
+
+    tsne = TSNE(verbose=1, perplexity=perplexity, random_state=random_seed)
+    sample_embedded = tsne.fit_transform(X_sample)
+
+    nearest_neighbors = NearestNeighbors(
+        n_neighbors=min(EMBEDDING_NEIGHBORS_COUNT, sample_size)
+    ).fit(X_sample)
+    X_embedded = np.empty((len(X_reduced), 2), dtype=np.float32)
+    offset = 0
+    for X_batch in iter_reduced_batches(X_reduced):
+        neighbor_indices = nearest_neighbors.kneighbors(X_batch, return_distance=False)
+        X_embedded[offset : offset + len(X_batch)] = sample_embedded[
+            neighbor_indices
+        ].mean(axis=1)
+        offset += len(X_batch)
+    # The sampled papers keep their own position
+    X_embedded[sample] = sample_embedded
+
+    return X_embedded
+
+
+def count_cluster_terms(
+    work_dir: str, batch_count: int, clusters: np.ndarray
+) -> dict[int, Counter]:
+    """Count the keyword candidates of the cleaned abstracts in each cluster,
+    with the same words as the keywords of the other time ranges."""
+
+    analyzer = get_keyword_vectorizer().build_analyzer()
+    cluster_term_counts = {}
+    offset = 0
+    for papers_df in iter_paper_batches(work_dir, batch_count, ["abstract_clean"]):
+        batch_clusters = clusters[offset : offset + len(papers_df)]
+        for cluster, abstract_clean in zip(batch_clusters, papers_df["abstract_clean"]):
+            cluster_term_counts.setdefault(int(cluster), Counter()).update(
+                analyzer(abstract_clean)
+            )
+        offset += len(papers_df)
+
+    return cluster_term_counts
+
+
+def get_keywords_from_term_counts(
+    cluster_term_counts: dict[int, Counter], k: int, top_n: int = 10
+) -> list[list[str]]:
+    """Get the keywords for each cluster with class-based TF-IDF."""
+
+    terms = sorted(set().union(*cluster_term_counts.values()))
+    term_indices = {term: i for i, term in enumerate(terms)}
+    term_counts = sparse.dok_matrix((k, len(terms)), dtype=np.float64)
+    for cluster, counts in cluster_term_counts.items():
+        for term, count in counts.items():
+            term_counts[cluster, term_indices[term]] = count
+
+    return get_class_tfidf_keywords(term_counts.tocsr(), np.array(terms), top_n)
@@ -0,0 +1,186 @@
+"""Exercise the request scheduler against a local stand-in server that injects
+delays and errors. Run from the repository root with `python -m pytest tests`."""
+
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from request_scheduler import RequestScheduler, ServerError, ThrottledError
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Answer /ok with a page that has an abstract, /no-abstract with a page
+    without one, /status/<code> with the status code, and /slow after a delay.
+    With ?fail=<n>, the first n requests of the path fail with a 503."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.active_requests = 0
+        self.max_active_requests = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        server = self.server
+        with server.lock:
+            hits = server.hits[url.path] = server.hits.get(url.path, 0) + 1
+            server.active_requests += 1
+            server.max_active_requests = max(
+                server.max_active_requests, server.active_requests
+            )
+        try:
+            time.sleep(float(query.get("delay", [0])[0]))
+            if hits <= int(query.get("fail", [0])[0]):
+                self.respond(503, "<title>503 Service Unavailable</title>")
+            elif url.path.startswith("/status/"):
+                self.respond(int(url.path.split("/")[-1]), "<title>Error</title>")
+            elif url.path == "/no-abstract":
+                self.respond(200, "<title>Paper</title>")
+            else:
+                self.respond(200, '<div class="abstractSection">Abstract</div>')
+        finally:
+            with server.lock:
+                server.active_requests -= 1
+
+    def respond(self, status: int, body: str):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def get_abstract(url: str, timeout: float = 1) -> str:
+    """Fetch the page and get its abstract, raising the errors the scraper raises."""
+
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            page = response.read().decode()
+    except urllib.error.HTTPError as error:
+        if error.code == 429:
+            raise ThrottledError(error.reason) from error
+        if error.code >= 500:
+            raise ServerError(error.reason) from error
+        raise
+    if "abstractSection" not in page:
+        # Like a missing element, it fails the same way on every attempt
+        raise LookupError("The page has no abstract")
+    return page
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_scheduler(**kwargs) -> RequestScheduler:
+    options = {
+        "rate": 1000,
+        "burst": 1000,
+        "max_retries": 3,
+        "base_backoff": 0.01,
+        "max_backoff": 0.05,
+        "target_latency": 0.5,
+    }
+    options.update(kwargs)
+    return RequestScheduler(**options)
+
+
+def test_server_errors_are_retried(server):
+    scheduler = get_scheduler()
+
+    scheduler.call(lambda: get_abstract(server.url + "/flaky?fail=2"))
+
+    assert server.hits["/flaky"] == 3
+    assert scheduler.failures == 2
+    assert scheduler.retryable_failures == 2
+
+
+def test_retries_give_up_after_max_retries(server):
+    scheduler = get_scheduler()
+
+    with pytest.raises(ThrottledError):
+        scheduler.call(lambda: get_abstract(server.url + "/status/429"))
+
+    assert server.hits["/status/429"] == scheduler.max_retries + 1
+
+
+def test_timeouts_are_retried(server):
+    scheduler = get_scheduler(max_retries=1)
+
+    with pytest.raises(TimeoutError):
+        scheduler.call(lambda: get_abstract(server.url + "/slow?delay=0.5", 0.1))
+
+    assert scheduler.retryable_failures == 2
+
+
+def test_missing_elements_are_not_retried(server):
+    scheduler = get_scheduler(min_concurrency=2)
+
+    with pytest.raises(LookupError):
+        scheduler.call(lambda: get_abstract(server.url + "/no-abstract"))
+
+    assert server.hits["/no-abstract"] == 1
+    assert scheduler.retryable_failures == 0
+    assert scheduler.concurrency_limit == 2
+
+
+def test_client_errors_are_not_retried(server):
+    scheduler = get_scheduler()
+
+    with pytest.raises(urllib.error.HTTPError):
+        scheduler.call(lambda: get_abstract(server.url + "/status/404"))
+
+    assert server.hits["/status/404"] == 1
+
+
+def test_concurrency_limit_grows_and_is_halved_when_overloaded(server):
+    scheduler = get_scheduler(max_concurrency=4)
+    for _ in range(10):
+        scheduler.call(lambda: get_abstract(server.url + "/ok"))
+    assert scheduler.concurrency_limit == 4
+
+    scheduler.call(lambda: get_abstract(server.url + "/overloaded?fail=1"))
+
+    # Halved by the failure, then grown by the successful retry
+    assert scheduler.concurrency_limit == pytest.approx(2.5)
+
+
+def test_concurrent_requests_stay_within_the_limit(server):
+    scheduler = get_scheduler(min_concurrency=2, max_concurrency=2)
+    threads = [
+        threading.Thread(
+            target=scheduler.call,
+            args=(lambda: get_abstract(server.url + "/slow?delay=0.1"),),
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.hits["/slow"] == 8
+    assert server.max_active_requests == 2
@@ -0,0 +1,5 @@
+from model.cluster_time_range import ClusterTimeRange
+from training_pipeline import cluster_papers_streaming
+
+
+cluster_papers_streaming(ClusterTimeRange.ALL_TIME)
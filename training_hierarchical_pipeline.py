@@ -0,0 +1,4 @@
+from training_pipeline import cluster_papers_hierarchical_with_drift_check
+
+
+cluster_papers_hierarchical_with_drift_check()
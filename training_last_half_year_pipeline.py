@@ -1,5 +1,5 @@
 from model.cluster_time_range import ClusterTimeRange
-from training_pipeline import cluster_papers
+from training_pipeline import cluster_papers_with_drift_check
 
 
-cluster_papers(ClusterTimeRange.LAST_HALF_YEAR)
+cluster_papers_with_drift_check(ClusterTimeRange.LAST_HALF_YEAR)
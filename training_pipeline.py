@@ -1,19 +1,59 @@
 from datetime import date, datetime
-import string
+import tempfile
+import time
+from typing import Callable, Iterator
 import hopsworks
 from hsfs.feature import Feature
+import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-import spacy
-from spacy.lang.en import STOP_WORDS
+from scipy import sparse
+from pynndescent import NNDescent
 from tqdm import tqdm
+from dateutil.relativedelta import relativedelta
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 from model.cluster_time_range import ClusterTimeRange
-from custom_stop_words import custom_stop_words
+from model.keyword_mode import KeywordMode
+from model.model_bundle import ModelBundle
+from model.drift_decision import DriftDecision
+from preprocessing import scraping_error, spacy_tokenizer
+from similarity_index import (
+    build_similarity_index,
+    get_similar_papers,
+    get_similar_papers_for_vectors,
+    save_similarity_index,
+)
+from artifact_store import (
+    get_artifacts_dir,
+    load_artifacts,
+    load_model_bundle,
+    save_artifacts,
+    save_model_bundle,
+)
+from cluster_assignment import ClusterAssigner
+import streaming_vectorization
+from feature_group_reader import read_compact
+from feature_group_writer import (
+    parse_publication_dates,
+    read_snapshot,
+    upsert_feature_group,
+)
+from drift_check import check_drift, check_paper_counts, get_drift_reference
+from knn_graph import (
+    get_2d_embeddings_from_knn_graph,
+    get_knn_graph,
+    get_knn_neighbors_count,
+    print_quality_metrics,
+)
+from class_tfidf import (
+    get_class_tfidf_keywords,
+    get_cluster_term_counts,
+    get_keyword_overlap,
+    get_keyword_vectorizer,
+)
 
 random_seed = 42
 
@@ -23,63 +63,99 @@ project = hopsworks.login()
 fs = project.get_feature_store()
 
 
+# columns of the papers that are used for the training
+PAPER_COLUMNS = ["citation", "abstract", "publication_date"]
+
+
 def get_papers(time_range: ClusterTimeRange) -> pd.DataFrame:
     """Get papers for the provided time range."""
-    df = (
+    df = read_compact(
         fs.get_feature_group("acm_papers", 1)
+        .select(PAPER_COLUMNS)
         .filter(
             (Feature("publication_date") >= time_range.get_start_date())
             & (Feature("publication_date") <= time_range.get_end_date())
         )
-        .read(read_options={"use_hive": True})
     )
     return df
 
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean the data."""
+def get_clean_papers_in_chunks(
+    time_range: ClusterTimeRange, months_per_chunk: int = 12
+) -> Iterator[pd.DataFrame]:
+    """Get the cleaned papers for the provided time range, in chunks of
+    consecutive months. The cleaned abstracts that are stored with the clustered
+    papers of the time range are reused, so only the new papers are cleaned."""
+
+    clustered_papers_fg = get_clustered_papers_feature_group(time_range)
+    chunk_start_date = time_range.get_start_date()
+    end_date = time_range.get_end_date()
+    while chunk_start_date <= end_date:
+        chunk_end_date = min(
+            chunk_start_date + relativedelta(months=months_per_chunk, days=-1),
+            end_date,
+        )
+        print(f"Reading papers from {chunk_start_date} to {chunk_end_date}")
+        df = read_compact(
+            fs.get_feature_group("acm_papers", 1)
+            .select(PAPER_COLUMNS)
+            .filter(
+                (Feature("publication_date") >= chunk_start_date)
+                & (Feature("publication_date") <= chunk_end_date)
+            )
+        )
+        stored_clean_df = None
+        if clustered_papers_fg.id is not None:
+            stored_clean_df = read_compact(
+                clustered_papers_fg.select(
+                    ["citation", "abstract", "abstract_clean"]
+                ).filter(
+                    (Feature("publication_date") >= chunk_start_date)
+                    & (Feature("publication_date") <= chunk_end_date)
+                )
+            )
+        yield clean_data(df, stored_clean_df)
+        chunk_start_date = chunk_end_date + relativedelta(days=1)
+
+
+def clean_data(
+    df: pd.DataFrame, stored_clean_df: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """Clean the data. If stored_clean_df is provided, the cleaned abstracts
+    of its papers with the same citation and abstract are reused."""
 
     df = df.drop_duplicates(subset=["abstract"], keep="first")
 
     # Remove "Abstract\n" from the beginning of the abstract, it's a scraping error
-    scraping_error = "Abstract\n"
     df["abstract"] = df["abstract"].str.replace(f"^{scraping_error}", "", regex=True)
 
     # Remove punctuation and stop words
 
-    punctuations = string.punctuation
-    stop_words = list(STOP_WORDS)
-
-    for word in custom_stop_words:
-        if word not in stop_words:
-            stop_words.append(word)
-
-    parser = spacy.load("en_core_web_trf", disable=["tagger", "ner"])
-
-    def spacy_tokenizer(sentence):
-        mytokens = parser(sentence)
-        mytokens = [
-            word.lemma_.lower().strip() if word.lemma_ != "-PRON-" else word.lower_
-            for word in mytokens
-        ]
-        mytokens = [
-            word
-            for word in mytokens
-            if word not in stop_words and word not in punctuations
-        ]
-        mytokens = " ".join([i for i in mytokens])
-        return mytokens
-
     # Show progress bar
     tqdm.pandas()
 
-    df["abstract_clean"] = df["abstract"].progress_apply(spacy_tokenizer)
+    if stored_clean_df is None:
+        df["abstract_clean"] = df["abstract"].progress_apply(spacy_tokenizer)
+        return df
+
+    df = df.merge(
+        stored_clean_df[["citation", "abstract", "abstract_clean"]],
+        on=["citation", "abstract"],
+        how="left",
+    )
+    is_cleaned = df["abstract_clean"].notna()
+    print(f"Reusing {is_cleaned.sum()} of {len(df)} cleaned abstracts")
+    df.loc[~is_cleaned, "abstract_clean"] = df.loc[
+        ~is_cleaned, "abstract"
+    ].progress_apply(spacy_tokenizer)
 
     return df
 
 
-def vectorize_abstracts(clean_abstracts: list[str]) -> list[list[float]]:
-    """Vectorize the abstracts."""
+def fit_vectorizer(
+    clean_abstracts: list[str],
+) -> tuple[TfidfVectorizer, PCA, list[list[float]]]:
+    """Fit the vectorizer and the reducer, and vectorize the abstracts."""
 
     vectorizer = TfidfVectorizer(
         max_features=2**12
@@ -89,7 +165,7 @@ def vectorize_abstracts(clean_abstracts: list[str]) -> list[list[float]]:
     pca = PCA(n_components=0.95, random_state=random_seed)
     X_reduced = pca.fit_transform(X.toarray())
 
-    return X_reduced
+    return vectorizer, pca, X_reduced
 
 
 def get_clusters_count(time_range: ClusterTimeRange) -> int:
@@ -102,37 +178,53 @@ def get_clusters_count(time_range: ClusterTimeRange) -> int:
         k = 6
     elif time_range == ClusterTimeRange.LAST_YEAR:
         k = 11
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        # not tuned yet, the plot palette supports at most 20 clusters
+        k = 15
 
     return k
 
 
-def kmeans_clustering(
+def fit_kmeans(X_reduced: list[list[float]], k: int) -> KMeans:
+    """Fit k-means clustering with k clusters."""
+
+    kmeans = KMeans(n_clusters=k, random_state=random_seed)
+    kmeans.fit(X_reduced)
+    return kmeans
+
+
+def get_perplexity(time_range: ClusterTimeRange) -> int:
+    """Get the t-SNE perplexity for the provided time range."""
+
+    if time_range in (ClusterTimeRange.LAST_YEAR, ClusterTimeRange.ALL_TIME):
+        perplexity = 50
+    else:
+        perplexity = 5
+
+    return perplexity
+
+
+def build_knn_graph(
     X_reduced: list[list[float]],
-    df: pd.DataFrame,
     time_range: ClusterTimeRange,
-) -> pd.DataFrame:
-    """Cluster the data using k-means clustering."""
+) -> tuple[NNDescent, sparse.csr_matrix]:
+    """Build the similarity index with as many neighbours as t-SNE needs,
+    and get its neighbour graph. The graph is computed once and shared by
+    the 2D embeddings, the quality metrics and the similar papers."""
 
-    kmeans = KMeans(n_clusters=get_clusters_count(time_range), random_state=random_seed)
-    clusters = kmeans.fit_predict(X_reduced)
-    df["cluster"] = clusters
-
-    return df
+    n_neighbors = get_knn_neighbors_count(get_perplexity(time_range))
+    similarity_index = build_similarity_index(X_reduced, n_neighbors)
+    return similarity_index, get_knn_graph(similarity_index)
 
 
 def get_2d_embeddings(
-    X_reduced: list[list[float]],
+    knn_graph: sparse.csr_matrix,
     time_range: ClusterTimeRange,
 ) -> list[list[float]]:
     """Get the 2D embeddings."""
 
-    if time_range == ClusterTimeRange.LAST_YEAR:
-        perplexity = 50
-    else:
-        perplexity = 5
-
-    tsne = TSNE(verbose=1, perplexity=perplexity, random_state=42)
-    X_embedded = tsne.fit_transform(X_reduced)
+    perplexity = get_perplexity(time_range)
+    X_embedded = get_2d_embeddings_from_knn_graph(knn_graph, perplexity)
 
     return X_embedded
 
@@ -229,35 +321,112 @@ def get_keywords_for_clusters(
     return all_keywords
 
 
-def save_clusters(
+def get_keywords_for_clusters_class_tfidf(
     df: pd.DataFrame,
-    all_keywords: list[list[str]],
     time_range: ClusterTimeRange,
-):
-    """Save the clusters."""
+) -> list[list[str]]:
+    """Get the keywords for each cluster with class-based TF-IDF.
+    The abstracts are vectorized once and the keywords of all clusters
+    are selected at once, instead of fitting an LDA model per cluster."""
+
+    k = get_clusters_count(time_range)
+
+    vectorizer = get_keyword_vectorizer()
+    X_counts = vectorizer.fit_transform(df["abstract_clean"])
+    cluster_term_counts = get_cluster_term_counts(X_counts, df["cluster"].values, k)
+    all_keywords = get_class_tfidf_keywords(
+        cluster_term_counts, vectorizer.get_feature_names_out()
+    )
+
+    for ii in range(0, k):
+        print("Cluster " + str(ii) + " topics:", all_keywords[ii])
+
+    return all_keywords
+
+
+def get_keywords(
+    df: pd.DataFrame,
+    time_range: ClusterTimeRange,
+    keyword_mode: KeywordMode,
+    compare_keywords: bool = False,
+) -> list[list[str]]:
+    """Get the keywords for each cluster with the provided keyword mode.
+    If compare_keywords is set, the keywords of the other mode are computed
+    too, and the overlap of the keywords of each cluster is reported."""
+
+    keyword_functions = {
+        KeywordMode.LDA: get_keywords_for_clusters,
+        KeywordMode.CLASS_TFIDF: get_keywords_for_clusters_class_tfidf,
+    }
+
+    start_time = time.perf_counter()
+    all_keywords = keyword_functions[keyword_mode](df, time_range)
+    duration = time.perf_counter() - start_time
+    print(f"Keywords extracted with {keyword_mode.name} in {duration:.2f}s")
+
+    if compare_keywords:
+        other_mode = (
+            KeywordMode.CLASS_TFIDF
+            if keyword_mode == KeywordMode.LDA
+            else KeywordMode.LDA
+        )
+        start_time = time.perf_counter()
+        other_keywords = keyword_functions[other_mode](df, time_range)
+        duration = time.perf_counter() - start_time
+        print(f"Keywords extracted with {other_mode.name} in {duration:.2f}s")
+        overlap = get_keyword_overlap(all_keywords, other_keywords)
+        for cluster, cluster_overlap in enumerate(overlap):
+            print(f"Cluster {cluster} keyword overlap: {cluster_overlap:.2f}")
+        print(f"Mean keyword overlap: {sum(overlap) / max(len(overlap), 1):.2f}")
+
+    return all_keywords
+
+
+def get_clustered_papers_feature_group(time_range: ClusterTimeRange):
+    """Get the feature group of the clustered papers for the provided time range."""
 
-    # Save clustered papers
     if time_range == ClusterTimeRange.LAST_MONTH:
         clustered_papers_fg_name = "acm_papers_clustered_last_month"
     elif time_range == ClusterTimeRange.LAST_HALF_YEAR:
         clustered_papers_fg_name = "acm_papers_clustered_last_half_year"
     elif time_range == ClusterTimeRange.LAST_YEAR:
         clustered_papers_fg_name = "acm_papers_clustered_last_year"
-    # for some reason, the publication_date column is not read as a date column
-    df["publication_date"] = [
-        datetime.strptime(date_string, "%Y-%m-%d").date()
-        for date_string in df["publication_date"]
-    ]
-    clustered_papers_fg = fs.get_or_create_feature_group(
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        clustered_papers_fg_name = "acm_papers_clustered_all_time"
+    # Version 2 added the similar papers, the schema of a version can't change
+    return fs.get_or_create_feature_group(
         name=clustered_papers_fg_name,
-        version=1,
+        version=2,
         description="Clustered papers",
         primary_key=["citation"],
         event_time="publication_date",
     )
-    clustered_papers_fg.insert(df, overwrite=True)
 
-    # Save cluster keywords
+
+def save_clustered_papers(
+    df: pd.DataFrame,
+    time_range: ClusterTimeRange,
+    append: bool = False,
+    write_options: dict | None = None,
+):
+    """Save the clustered papers. Only the changed papers are written,
+    unless append is set, in which case all papers are upserted without
+    comparing them to the stored ones first, with the provided write options."""
+
+    df["publication_date"] = parse_publication_dates(df["publication_date"])
+    clustered_papers_fg = get_clustered_papers_feature_group(time_range)
+    if append:
+        clustered_papers_fg.insert(df, write_options=write_options or {})
+    else:
+        upsert_feature_group(clustered_papers_fg, df, "citation")
+
+
+def save_cluster_keywords(
+    all_keywords: list[list[str]],
+    time_range: ClusterTimeRange,
+):
+    """Save the cluster keywords."""
+
     all_keywords_strings = []
     for cluster_keywords in all_keywords:
         all_keywords_strings.append(", ".join(cluster_keywords))
@@ -270,25 +439,439 @@ def save_clusters(
         keywords_fg_name = "acm_papers_cluster_keywords_last_half_year"
     elif time_range == ClusterTimeRange.LAST_YEAR:
         keywords_fg_name = "acm_papers_cluster_keywords_last_year"
+    elif time_range == ClusterTimeRange.ALL_TIME:
+        keywords_fg_name = "acm_papers_cluster_keywords_all_time"
     keywords_fg = fs.get_or_create_feature_group(
         name=keywords_fg_name,
         version=1,
         description="The keywords for each cluster",
         primary_key=["cluster"],
     )
-    keywords_fg.insert(df_keywords, overwrite=True)
+    upsert_feature_group(keywords_fg, df_keywords, "cluster")
+
+
+def save_clusters(
+    df: pd.DataFrame,
+    all_keywords: list[list[str]],
+    time_range: ClusterTimeRange,
+):
+    """Save the clusters."""
+
+    save_clustered_papers(df, time_range)
+    save_cluster_keywords(all_keywords, time_range)
+
+
+def cluster_papers(
+    time_range: ClusterTimeRange,
+    keyword_mode: KeywordMode = KeywordMode.LDA,
+    compare_keywords: bool = False,
+    papers_df: pd.DataFrame | None = None,
+):
+    """Cluster papers for the provided time range.
+    The papers are read and cleaned, unless the cleaned papers are provided."""
+
+    if papers_df is None:
+        papers_df = get_papers(time_range)
+        papers_df = clean_data(papers_df)
+    clean_abstracts = papers_df["abstract_clean"].values.tolist()
+    vectorizer, pca, X_reduced = fit_vectorizer(clean_abstracts)
+    kmeans = fit_kmeans(X_reduced, get_clusters_count(time_range))
+    papers_df["cluster"] = kmeans.labels_
+    similarity_index, knn_graph = build_knn_graph(X_reduced, time_range)
+    X_embedded = get_2d_embeddings(knn_graph, time_range)
+    papers_df["x_coord"] = X_embedded[:, 0]
+    papers_df["y_coord"] = X_embedded[:, 1]
+    print_quality_metrics(knn_graph, kmeans.labels_, X_embedded)
+    save_clustering_results(
+        papers_df,
+        X_reduced,
+        vectorizer,
+        pca,
+        kmeans,
+        time_range,
+        time_range,
+        keyword_mode,
+        compare_keywords,
+        similarity_index,
+    )
 
 
-def cluster_papers(time_range: ClusterTimeRange):
-    """Cluster papers for the provided time range."""
+def save_clustering_results(
+    papers_df: pd.DataFrame,
+    X_reduced: list[list[float]],
+    vectorizer: TfidfVectorizer,
+    pca: PCA,
+    kmeans: KMeans,
+    time_range: ClusterTimeRange,
+    clusters_time_range: ClusterTimeRange,
+    keyword_mode: KeywordMode,
+    compare_keywords: bool,
+    similarity_index: NNDescent | None = None,
+):
+    """Find the similar papers and the keywords of the clustered papers, and
+    save them together with the fitted models. clusters_time_range is the time
+    range the clusters were fitted for, which determines the number of clusters.
+    The similarity index is built, unless it was already built for the papers."""
+
+    if similarity_index is None:
+        similarity_index = build_similarity_index(X_reduced)
+    citations = papers_df["citation"].values.tolist()
+    papers_df["similar_papers"] = get_similar_papers(similarity_index, citations)
+    all_keywords = get_keywords(
+        papers_df, clusters_time_range, keyword_mode, compare_keywords
+    )
+    save_clusters(papers_df, all_keywords, time_range)
+    artifacts_dir = get_artifacts_dir(time_range)
+    save_similarity_index(similarity_index, X_reduced, citations, artifacts_dir)
+    bundle = ModelBundle(
+        vectorizer=vectorizer,
+        pca=pca,
+        kmeans=kmeans,
+        similarity_index=similarity_index,
+        embeddings=papers_df[["x_coord", "y_coord"]].values,
+        citations=citations,
+        drift_reference=get_drift_reference(
+            vectorizer, kmeans, X_reduced, papers_df["abstract_clean"]
+        ),
+    )
+    save_model_bundle(bundle, artifacts_dir)
+    save_artifacts(artifacts_dir, time_range)
+
 
+def save_drift_check(
+    time_range: ClusterTimeRange, decision: DriftDecision, metrics: dict
+):
+    """Record the decision of the drift check together with its metrics."""
+
+    df = pd.DataFrame(
+        [
+            {
+                "time_range": time_range.name.lower(),
+                "checked_at": datetime.now(),
+                "decision": decision.name.lower(),
+                **metrics,
+            }
+        ]
+    )
+    drift_checks_fg = fs.get_or_create_feature_group(
+        name="acm_papers_drift_checks",
+        version=1,
+        description="The decisions of the drift checks before training",
+        primary_key=["time_range", "checked_at"],
+        event_time="checked_at",
+    )
+    drift_checks_fg.insert(df)
+
+
+def cluster_papers_with_drift_check(
+    time_range: ClusterTimeRange,
+    keyword_mode: KeywordMode = KeywordMode.LDA,
+):
+    """Cluster papers for the provided time range, unless the saved model
+    still fits them, see update_with_drift_check."""
+
+    update_with_drift_check(
+        time_range,
+        lambda papers_df: cluster_papers(time_range, keyword_mode, papers_df=papers_df),
+    )
+
+
+def update_with_drift_check(
+    time_range: ClusterTimeRange,
+    refit: Callable[[pd.DataFrame], None],
+) -> pd.DataFrame | None:
+    """Refit the model of the provided time range with refit, which gets the
+    cleaned papers, unless the saved model still fits them. The numbers of new
+    and expired papers alone can already require a refit. Otherwise, only the
+    papers that the model hasn't seen are cleaned and vectorized, and compared
+    with the training papers. If they fit the model, they are assigned to its
+    clusters and placed on its map, without refitting. The new papers aren't
+    added to the model, so they accumulate until the share of new papers alone
+    forces a full refit. Each paper is cleaned at most once, also when the
+    model is refitted. Returns the clustered papers if they were updated
+    without refitting, otherwise None."""
+
+    artifacts_dir = load_artifacts(time_range)
+    bundle = load_model_bundle(artifacts_dir) if artifacts_dir is not None else None
     papers_df = get_papers(time_range)
-    papers_df = clean_data(papers_df)
+    papers_df = papers_df.drop_duplicates(subset=["abstract"], keep="first")
+    model_citations = set(bundle.citations) if bundle is not None else set()
+    is_new = ~papers_df["citation"].isin(model_citations).values
+    expired_papers_count = len(model_citations - set(papers_df["citation"]))
+    decision, metrics = check_paper_counts(
+        len(papers_df), int(is_new.sum()), expired_papers_count, len(model_citations)
+    )
+
+    new_papers_df = None
+    if decision is None:
+        new_papers_df = clean_data(papers_df[is_new].copy())
+        assigner = ClusterAssigner(bundle)
+        if len(new_papers_df) > 0:
+            X_new = assigner.vectorize(new_papers_df["abstract_clean"].values.tolist())
+        else:
+            X_new = np.empty((0, bundle.pca.n_components_))
+        decision, metrics = check_drift(
+            bundle.vectorizer,
+            bundle.kmeans,
+            bundle.drift_reference,
+            X_new,
+            new_papers_df["abstract_clean"].values.tolist(),
+            metrics,
+        )
+    print(f"Drift check for {time_range.name}: {decision.name}, {metrics}")
+    save_drift_check(time_range, decision, metrics)
+
+    def refit_papers():
+        # Only the papers that weren't cleaned for the drift check are cleaned
+        if new_papers_df is None:
+            clean_papers_df = clean_data(papers_df)
+        else:
+            clean_papers_df = pd.concat(
+                [clean_data(papers_df[~is_new].copy()), new_papers_df],
+                ignore_index=True,
+            )
+        refit(clean_papers_df)
+
+    if decision == DriftDecision.FULL_REFIT:
+        refit_papers()
+    elif decision == DriftDecision.INCREMENTAL_UPDATE:
+        # The stored papers keep their clusters and positions, the expired
+        # ones are deleted by the upsert. The keywords stay the same.
+        snapshot_df = read_snapshot(get_clustered_papers_feature_group(time_range))
+        if snapshot_df is None:
+            print(f"No clustered papers stored for {time_range.name}, refitting")
+            refit_papers()
+            return None
+
+        if len(new_papers_df) > 0:
+            clusters, x_coords, y_coords = assigner.assign_vectors(X_new)
+            new_papers_df["cluster"] = clusters
+            new_papers_df["x_coord"] = x_coords
+            new_papers_df["y_coord"] = y_coords
+            new_papers_df["similar_papers"] = get_similar_papers_for_vectors(
+                bundle.similarity_index, bundle.citations, X_new
+            )
+
+        snapshot_df = snapshot_df[snapshot_df["citation"].isin(papers_df["citation"])]
+        clustered_df = pd.concat(
+            [snapshot_df, new_papers_df.reindex(columns=snapshot_df.columns)],
+            ignore_index=True,
+        )
+        save_clustered_papers(clustered_df.copy(), time_range)
+        return clustered_df
+    elif decision == DriftDecision.NO_CHANGE:
+        print(f"No new or expired papers for {time_range.name}, nothing to update")
+
+    return None
+
+
+def is_in_time_range(
+    publication_dates: pd.Series, time_range: ClusterTimeRange
+) -> np.ndarray:
+    """Get whether each publication date is in the provided time range."""
+
+    return (
+        (publication_dates >= time_range.get_start_date())
+        & (publication_dates <= time_range.get_end_date())
+    ).values
+
+
+def cluster_papers_hierarchical_with_drift_check(
+    keyword_mode: KeywordMode = KeywordMode.LDA,
+):
+    """Cluster papers for all time ranges with a single model fitted on the last
+    year, unless the saved model of the last year still fits its papers. Then
+    the new papers are only assigned to the year's clusters, see
+    update_with_drift_check, and the last half year and the last month are
+    taken from the updated papers of the year, with the year's clusters.
+    Most of their papers are new each month, so their keywords are extracted
+    again, which is cheap for their few papers."""
+
+    year_time_range = ClusterTimeRange.LAST_YEAR
+    year_clustered_df = update_with_drift_check(
+        year_time_range,
+        lambda papers_df: cluster_papers_hierarchical(
+            keyword_mode, papers_df=papers_df
+        ),
+    )
+    if year_clustered_df is None:
+        return
+
+    publication_dates = parse_publication_dates(year_clustered_df["publication_date"])
+    for time_range in (ClusterTimeRange.LAST_HALF_YEAR, ClusterTimeRange.LAST_MONTH):
+        time_range_df = year_clustered_df[
+            is_in_time_range(publication_dates, time_range)
+        ]
+        snapshot_df = read_snapshot(get_clustered_papers_feature_group(time_range))
+        if snapshot_df is not None:
+            # The papers that stay in the time range keep their similar papers,
+            # which were found among the papers of the time range
+            snapshot_df = snapshot_df[
+                snapshot_df["citation"].isin(time_range_df["citation"])
+            ]
+            time_range_df = pd.concat(
+                [
+                    snapshot_df,
+                    time_range_df[
+                        ~time_range_df["citation"].isin(snapshot_df["citation"])
+                    ].reindex(columns=snapshot_df.columns),
+                ],
+                ignore_index=True,
+            )
+        all_keywords = get_keywords(time_range_df, year_time_range, keyword_mode)
+        save_clusters(time_range_df.copy(), all_keywords, time_range)
+
+
+def cluster_papers_hierarchical(
+    keyword_mode: KeywordMode = KeywordMode.LDA,
+    reuse_year_centroids: bool = True,
+    papers_df: pd.DataFrame | None = None,
+):
+    """Cluster papers for all time ranges with a single model fitted on the last year.
+    The last half year and the last month are subsets of the last year, so their
+    papers keep their vectors and 2D embeddings from the year. Their clusters are
+    either the year's clusters, which makes them comparable across the time ranges,
+    or the year vectors are sub-clustered with the time range's number of clusters.
+    The papers of the last year are read and cleaned, unless the cleaned papers
+    are provided."""
+
+    year_time_range = ClusterTimeRange.LAST_YEAR
+    if papers_df is None:
+        papers_df = get_papers(year_time_range)
+        papers_df = clean_data(papers_df)
     clean_abstracts = papers_df["abstract_clean"].values.tolist()
-    X_reduced = vectorize_abstracts(clean_abstracts)
-    papers_df = kmeans_clustering(X_reduced, papers_df, time_range)
-    X_embedded = get_2d_embeddings(X_reduced, time_range)
+    vectorizer, pca, X_reduced = fit_vectorizer(clean_abstracts)
+    year_kmeans = fit_kmeans(X_reduced, get_clusters_count(year_time_range))
+    papers_df["cluster"] = year_kmeans.labels_
+    year_similarity_index, knn_graph = build_knn_graph(X_reduced, year_time_range)
+    X_embedded = get_2d_embeddings(knn_graph, year_time_range)
     papers_df["x_coord"] = X_embedded[:, 0]
     papers_df["y_coord"] = X_embedded[:, 1]
-    all_keywords = get_keywords_for_clusters(papers_df, time_range)
-    save_clusters(papers_df, all_keywords, time_range)
+    print_quality_metrics(knn_graph, year_kmeans.labels_, X_embedded)
+    publication_dates = parse_publication_dates(papers_df["publication_date"])
+
+    for time_range in (ClusterTimeRange.LAST_HALF_YEAR, ClusterTimeRange.LAST_MONTH):
+        is_in_range = is_in_time_range(publication_dates, time_range)
+        time_range_df = papers_df[is_in_range].copy()
+        X_time_range = X_reduced[is_in_range]
+        if reuse_year_centroids:
+            clusters_time_range = year_time_range
+            kmeans = year_kmeans
+        else:
+            clusters_time_range = time_range
+            kmeans = fit_kmeans(X_time_range, get_clusters_count(time_range))
+            time_range_df["cluster"] = kmeans.labels_
+        save_clustering_results(
+            time_range_df,
+            X_time_range,
+            vectorizer,
+            pca,
+            kmeans,
+            time_range,
+            clusters_time_range,
+            keyword_mode,
+            False,
+        )
+
+    save_clustering_results(
+        papers_df,
+        X_reduced,
+        vectorizer,
+        pca,
+        year_kmeans,
+        year_time_range,
+        year_time_range,
+        keyword_mode,
+        False,
+        year_similarity_index,
+    )
+
+
+def cluster_papers_streaming(time_range: ClusterTimeRange):
+    """Cluster papers for the provided time range out-of-core.
+    The papers are read, vectorized, reduced and clustered in batches,
+    so the peak memory doesn't depend on the number of papers. Only the
+    reduced vectors of all papers are kept in memory, for the similarity index."""
+
+    k = get_clusters_count(time_range)
+    with tempfile.TemporaryDirectory() as work_dir:
+        (
+            batch_count,
+            papers_count,
+            idf,
+        ) = streaming_vectorization.hash_abstracts_to_disk(
+            get_clean_papers_in_chunks(time_range), work_dir
+        )
+        if papers_count < streaming_vectorization.STREAMING_COMPONENTS_COUNT:
+            # Too few papers to fit the incremental PCA, but they fit in memory
+            print(f"Only {papers_count} papers, clustering them in memory")
+            papers_df = pd.concat(
+                streaming_vectorization.iter_paper_batches(work_dir, batch_count),
+                ignore_index=True,
+            )
+            cluster_papers(time_range, KeywordMode.CLASS_TFIDF, papers_df=papers_df)
+            return
+        pca, X_reduced = streaming_vectorization.reduce_incrementally(
+            work_dir, batch_count, idf
+        )
+        kmeans, clusters = streaming_vectorization.cluster_incrementally(X_reduced, k)
+        X_embedded = streaming_vectorization.embed_with_sample(
+            X_reduced, get_perplexity(time_range)
+        )
+        # 100 float32 values per paper, so the vectors of all papers fit in memory
+        X_reduced = np.array(X_reduced)
+        similarity_index = build_similarity_index(X_reduced)
+        citations = pd.concat(
+            streaming_vectorization.iter_paper_batches(
+                work_dir, batch_count, ["citation"]
+            ),
+            ignore_index=True,
+        )["citation"].tolist()
+        similar_papers = get_similar_papers(similarity_index, citations)
+
+        offset = 0
+        batches = streaming_vectorization.iter_paper_batches(work_dir, batch_count)
+        for batch, papers_df in enumerate(batches):
+            batch_end = offset + len(papers_df)
+            papers_df["cluster"] = clusters[offset:batch_end]
+            papers_df["x_coord"] = X_embedded[offset:batch_end, 0]
+            papers_df["y_coord"] = X_embedded[offset:batch_end, 1]
+            papers_df["similar_papers"] = similar_papers[offset:batch_end]
+            # Papers never leave the all time range, so nothing has to be deleted.
+            # The offline feature group is materialized once, after the last batch.
+            save_clustered_papers(
+                papers_df,
+                time_range,
+                append=True,
+                write_options={
+                    "start_offline_materialization": batch == batch_count - 1
+                },
+            )
+            offset = batch_end
+
+        cluster_term_counts = streaming_vectorization.count_cluster_terms(
+            work_dir, batch_count, clusters
+        )
+        all_keywords = streaming_vectorization.get_keywords_from_term_counts(
+            cluster_term_counts, k
+        )
+        for cluster, keywords in enumerate(all_keywords):
+            print("Cluster " + str(cluster) + " topics:", keywords)
+        save_cluster_keywords(all_keywords, time_range)
+
+        # The models are saved like those of the other time ranges, so that new
+        # papers can be assigned to the clusters. The hashing vectorizer has no
+        # vocabulary to compare new papers with, so there is no drift reference.
+        artifacts_dir = get_artifacts_dir(time_range)
+        save_similarity_index(similarity_index, X_reduced, citations, artifacts_dir)
+        bundle = ModelBundle(
+            vectorizer=streaming_vectorization.get_tfidf_vectorizer(idf),
+            pca=pca,
+            kmeans=kmeans,
+            similarity_index=similarity_index,
+            embeddings=X_embedded,
+            citations=citations,
+            drift_reference={},
+        )
+        save_model_bundle(bundle, artifacts_dir)
+        save_artifacts(artifacts_dir, time_range)